@@ -1,7 +1,6 @@
 import streamlit as st
 import numpy as np
 import plotly.express as px
-from PIL import Image
 import requests
 from io import BytesIO
 import time
@@ -10,7 +9,21 @@ from tensorflow.keras.preprocessing import image
 import cv2
 import tempfile
 import os
+import shutil
 import gdown
+from feedback import AlmacenFeedback, Reentrenador
+from carga_imagenes import LIMITE_BYTES, ImagenRechazada, cargar_imagen, hash_contenido
+from registro_modelos import RegistroModelos, iniciar_contenedor
+from trabajos import GestorTrabajos
+from explicabilidad import obtener_explicador, superponer_mapa
+from video import DIRECTORIO_VIDEOS, analizar_video, listar_videos
+from servidor_workers import MODO_SERVICIO, ServidorWorkers, exportar_tflite
+from exportacion_municipal import AlmacenEventos
+from impacto import describir_beneficios
+import calibracion
+from calibracion import CLASE_NO_RECONOCIDA, Calibrador
+import metricas
+from metricas import medir
 
 # --- Configuración de página ---
 st.set_page_config(
@@ -25,28 +38,62 @@ st.set_page_config(
 )
 
 # --- Cargar modelo ---
+def importar_modelo_legado():
+    # El archivo heredado no trae metadatos: este es el único lugar donde viven sus clases y carpetas
+    modelo_path = "modelo_residuos.keras"
+    file_id = "12bLgOTa53KNtiAu6CsapqGAV9KTofZjy"
+    url = f"https://drive.google.com/uc?id={file_id}"
+
+    if not os.path.exists(modelo_path):
+        st.info("Descargando modelo desde Google Drive...")
+        gdown.download(url, modelo_path, quiet=False)
+
+    clases_legado = ['cartón', 'vidrio', 'metal', 'papel', 'plástico', 'basura']
+    # Carpetas del dataset del notebook, en el mismo orden (flow_from_directory las ordena alfabéticamente)
+    carpetas_legado = ['cardboard', 'glass', 'metal', 'paper', 'plastic', 'trash']
+    return tf.keras.models.load_model(modelo_path), clases_legado, carpetas_legado
+
 @st.cache_resource
 def cargar_modelo():
     with st.spinner("Cargando modelo de IA... Esto puede tardar un momento."):
         try:
-            modelo_path = "modelo_residuos.keras"
-            file_id = "12bLgOTa53KNtiAu6CsapqGAV9KTofZjy"
-            url = f"https://drive.google.com/uc?id={file_id}"
-
-            if not os.path.exists(modelo_path):
-                st.info("Descargando modelo desde Google Drive...")
-                gdown.download(url, modelo_path, quiet=False)
-
-            model = tf.keras.models.load_model(modelo_path)
+            contenedor = iniciar_contenedor(RegistroModelos(), importar_modelo_legado)
+            contenedor.vigilar()
             st.success("¡Modelo cargado con éxito!")
-            return model
+            return contenedor
 
         except Exception as e:
             st.error(f"Error al cargar el modelo: {e}. Asegúrate de que el archivo esté accesible.")
             st.stop()
 
 modelo = cargar_modelo()
-clases_residuos = ['cartón', 'vidrio', 'metal', 'papel', 'plástico', 'basura']
+
+# --- Servicio multiproceso (MODO_SERVICIO=workers) ---
+@st.cache_resource
+def cargar_servidor_workers():
+    if MODO_SERVICIO != "workers":
+        return None
+    estado = modelo.actual()
+    servidor = ServidorWorkers(exportar_tflite(modelo.registro, estado), estado.version)
+    # Cada nueva versión del registro se exporta y los workers se relevan sin cortar peticiones
+    modelo.suscribir(lambda estado: servidor.recargar(exportar_tflite(modelo.registro, estado), estado.version))
+    return servidor
+
+servidor_workers = cargar_servidor_workers()
+
+# --- Endpoint de métricas (solo si se define METRICAS_PUERTO) ---
+@st.cache_resource
+def iniciar_metricas():
+    return metricas.iniciar_servidor()
+
+iniciar_metricas()
+
+# --- Eventos para la exportación municipal (Parquet por día + agregados) ---
+@st.cache_resource
+def cargar_almacen_eventos():
+    return AlmacenEventos().iniciar()
+
+almacen_eventos = cargar_almacen_eventos()
 
 # --- Categorías extendidas ---
 tipo_residuo = {
@@ -58,6 +105,20 @@ tipo_residuo = {
     'basura': 'Inorgánico'
 }
 
+# --- Feedback y reentrenamiento ---
+@st.cache_resource
+def cargar_reentrenador():
+    return Reentrenador(AlmacenFeedback(), modelo, preprocess_image)
+
+# --- Calibración de la confianza y rechazo de lo desconocido ---
+@st.cache_resource
+def cargar_calibrador():
+    calibrador = Calibrador(modelo, preprocess_image)
+    # Cada versión nueva (legado, feedback o activada a mano) se calibra sola en segundo plano
+    modelo.suscribir(calibrador.asegurar)
+    calibrador.asegurar()
+    return calibrador
+
 # --- Información detallada por clase ---
 
 info_detalle_clase = {
@@ -111,6 +172,16 @@ info_detalle_clase = {
     }
 }
 
+# Ficha para las imágenes que el modelo rechaza por no parecerse a ninguna clase
+info_no_reconocido = {
+    "descripcion": "El modelo no reconoce este objeto como ninguno de los residuos con los que fue entrenado.",
+    "consejos": [
+        "Fotografía un solo objeto, centrado, sobre un fondo simple y con buena luz",
+        "Si es un residuo, indica su clase en el formulario de abajo para ayudar a mejorar el modelo"
+    ],
+    "icono": "❓"
+}
+
 # --- Estilos personalizados ---
 st.markdown(
     """
@@ -325,9 +396,13 @@ if "contador_clasificaciones" not in st.session_state:
     st.session_state["contador_clasificaciones"] = 0
 
 # --- Pestañas ---
-pestana_clasificador, pestana_info, pestana_historial, pestana_faq, pestana_about = st.tabs(
-    ["🧠 Clasificador", "📘 Información Educativa", "📜 Historial", "❓ Preguntas Frecuentes", "ℹ️ Acerca de"]
-)
+# La pestaña de administración queda oculta salvo con ?admin=1 en la URL
+modo_admin = st.query_params.get("admin") == "1"
+nombres_pestanas = ["🧠 Clasificador", "📦 Lotes", "🎬 Video", "📘 Información Educativa", "📜 Historial", "❓ Preguntas Frecuentes", "ℹ️ Acerca de"]
+if modo_admin:
+    nombres_pestanas.append("🛠️ Admin")
+pestanas = st.tabs(nombres_pestanas)
+pestana_clasificador, pestana_lotes, pestana_video, pestana_info, pestana_historial, pestana_faq, pestana_about = pestanas[:7]
 
 # --- Función para mostrar confeti ---
 def show_confetti():
@@ -354,6 +429,14 @@ def show_confetti():
     </script>
     """, unsafe_allow_html=True)
 
+# --- Función para decodificar la imagen subida ---
+# Se cachea por hash de contenido para no volver a decodificar en cada recarga del script
+@st.cache_data(max_entries=8, show_spinner=False)
+def decodificar_entrada(hash_imagen, _datos):
+    # Se mide aquí dentro: los aciertos de caché de las recargas no son decodificaciones reales
+    with medir("decodificacion"):
+        return cargar_imagen(_datos)
+
 # --- Función para preprocesar imagen ---
 def preprocess_image(img, target_size=(224, 224)):
     # Convertir a RGB si es necesario
@@ -370,18 +453,168 @@ def preprocess_image(img, target_size=(224, 224)):
     
     return img_array
 
+calibrador = cargar_calibrador()
+
+# --- Función de inferencia sobre un lote ya preprocesado ---
+def inferir(img_array, estado):
+    with medir("inferencia", imagenes=len(img_array)):
+        if servidor_workers is not None:
+            (embedding, pred), version = servidor_workers.clasificar(img_array)
+            # Mientras se exporta y arranca el grupo de la versión nueva los workers siguen con la
+            # anterior: su embedding no vale para la cabeza de este estado, se repite en local
+            if version == estado.version:
+                return embedding, pred
+        embedding, pred = estado.extractor(img_array, training=False)
+    return np.asarray(embedding), np.asarray(pred)
+
+# --- Función para pasar de embeddings a (clase, confianza calibrada, tipo, probabilidades) ---
+def interpretar_prediccion(embedding, estado):
+    # Los logits salen del embedding con la capa final: no hace falta otra pasada por el modelo
+    with medir("calibracion"):
+        probabilidades, reconocidos = calibracion.aplicar(estado, embedding)
+    resultados = []
+    for fila, reconocido in zip(probabilidades, reconocidos):
+        clase = estado.clases[int(np.argmax(fila))] if reconocido else CLASE_NO_RECONOCIDA
+        resultados.append((clase, float(np.max(fila)) * 100, tipo_residuo.get(clase, "Desconocido"), fila))
+    return resultados
+
 # --- Función para clasificar imagen ---
-def classify_image(img, model):
+def classify_image(img, estado, con_mapa=False, hash_imagen=None):
+    # Quien llama fija el estado (modelo.actual()): con el mismo se leen luego las clases y el umbral,
+    # aunque el modelo se reemplace mientras tanto
+    
     # Preprocesamiento
-    img_array = preprocess_image(img)
+    with medir("preprocesamiento"):
+        img_array = preprocess_image(img, estado.input_size)
     
-    # Predicción
-    pred = model.predict(img_array)
-    clase_predicha = clases_residuos[np.argmax(pred)]
-    confianza = np.max(pred) * 100
-    tipo = tipo_residuo.get(clase_predicha, "Desconocido")
+    # Predicción (con Grad-CAM, en la misma pasada)
+    mapa = None
+    if con_mapa:
+        embedding, pred, mapas = obtener_explicador(estado).explicar(img_array, [hash_imagen])
+        mapa = mapas[0]
+    else:
+        embedding, pred = inferir(img_array, estado)
+    clase_predicha, confianza, tipo, probabilidades = interpretar_prediccion(embedding, estado)[0]
     
-    return clase_predicha, confianza, tipo, pred[0]
+    return clase_predicha, confianza, tipo, probabilidades, embedding[0], mapa
+
+# --- Función para clasificar un lote de imágenes en una sola pasada ---
+def classify_batch(imagenes, contenedor, con_mapa=False, origen=None, hashes=None):
+    estado = contenedor.actual()
+    
+    with medir("preprocesamiento"):
+        lote = np.concatenate([preprocess_image(img, estado.input_size) for img in imagenes])
+    
+    mapas = [None] * len(imagenes)
+    if con_mapa:
+        # Con los hashes, las imágenes ya explicadas (en la vista individual o en otro lote) salen de la caché
+        embedding, _, mapas = obtener_explicador(estado).explicar(lote, hashes)
+    else:
+        embedding, _ = inferir(lote, estado)
+    resultados = []
+    for (clase, confianza, tipo, _), mapa in zip(interpretar_prediccion(embedding, estado), mapas):
+        metricas.CLASIFICACIONES.inc(clase=clase)
+        if origen:
+            almacen_eventos.registrar(clase, tipo, confianza, origen=origen)
+        resultados.append((clase, confianza, tipo, mapa))
+    return resultados
+
+# --- Función para leer la ubicación opcional ("lat, lon") ---
+def leer_ubicacion(texto):
+    try:
+        latitud, longitud = (float(valor) for valor in texto.split(","))
+    except ValueError:
+        return None, None
+    if -90 <= latitud <= 90 and -180 <= longitud <= 180:
+        return latitud, longitud
+    return None, None
+
+# --- Función para anotar una imagen con OpenCV ---
+def anotar_imagen(img, clase, confianza, mapa=None):
+    img_annotated = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+    
+    # Mapa de calor Grad-CAM debajo del texto
+    if mapa is not None:
+        img_annotated = superponer_mapa(img_annotated, mapa)
+    
+    # El texto escala con la imagen para que se lea igual en miniaturas y en originales
+    escala = min(2.0, max(0.4, img_annotated.shape[1] / 640))
+    text = f"{clase} ({confianza:.1f}%)"
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    posicion = (int(20 * escala), int(50 * escala))
+    cv2.putText(img_annotated, text, posicion, font, escala, (0, 255, 0), max(1, int(2 * escala)), cv2.LINE_AA)
+    return img_annotated
+
+# --- Cola de trabajos por lotes ---
+@st.cache_resource
+def cargar_gestor_trabajos():
+    return GestorTrabajos(lambda imagenes, con_mapa, hashes: classify_batch(imagenes, modelo, con_mapa,
+                                                                            origen="lote", hashes=hashes),
+                          anotar_imagen)
+
+@st.cache_data(max_entries=4, ttl=3600, show_spinner=False)
+def exportar_trabajo(id_trabajo):
+    # Solo se llama con trabajos terminados, cuyo resultado ya no cambia; el ZIP lleva todas las
+    # miniaturas, así que se guardan pocos y caducan para no acumular lotes grandes en memoria
+    gestor = cargar_gestor_trabajos()
+    return gestor.exportar_csv(id_trabajo), gestor.exportar_zip(id_trabajo)
+
+def _progreso_y_resultados(gestor, id_trabajo, progreso):
+    st.progress(
+        progreso["procesados"] / max(progreso["total"], 1),
+        text=f"Trabajo {id_trabajo}: {progreso['procesados']} de {progreso['total']} imágenes procesadas",
+    )
+    
+    # Resultados parciales a medida que llegan
+    resultados = gestor.resultados(id_trabajo)
+    if resultados:
+        reciclables = sum(1 for r in resultados if r["tipo"] == "Reciclable")
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Procesadas", len(resultados))
+        col2.metric("Reciclables", reciclables)
+        col3.metric("Errores", sum(1 for r in resultados if r["estado"] == "error"))
+        
+        st.dataframe(
+            [{"Archivo": r["nombre"], "Clase": r["clase"] or "—",
+              "Confianza (%)": round(r["confianza"], 1) if r["confianza"] is not None else None,
+              "Tipo": r["tipo"] or r["error"]} for r in resultados],
+            use_container_width=True,
+        )
+        miniaturas = [r["miniatura"] for r in resultados if r["miniatura"]][-8:]
+        if miniaturas:
+            st.image(miniaturas, width=150)
+
+# Solo los trabajos en marcha se refrescan cada 2 s; al terminar se rehace la página una vez y el
+# trabajo pasa al fragmento sin refresco, que ya no vuelve a consultar la base de datos
+@st.fragment(run_every=2)
+def mostrar_trabajo_en_curso(id_trabajo):
+    gestor = cargar_gestor_trabajos()
+    progreso = gestor.progreso(id_trabajo)
+    if not progreso or progreso["estado"] == "terminado":
+        st.rerun()
+    _progreso_y_resultados(gestor, id_trabajo, progreso)
+
+@st.fragment
+def mostrar_trabajo_terminado(id_trabajo, progreso):
+    gestor = cargar_gestor_trabajos()
+    _progreso_y_resultados(gestor, id_trabajo, progreso)
+    datos_csv, datos_zip = exportar_trabajo(id_trabajo)
+    col_dl1, col_dl2 = st.columns(2)
+    with col_dl1:
+        st.download_button("📥 Descargar resultados (CSV)", datos_csv,
+                           file_name=f"lote_{id_trabajo}.csv", mime="text/csv")
+    with col_dl2:
+        st.download_button("🗜️ Descargar miniaturas anotadas (ZIP)", datos_zip,
+                           file_name=f"lote_{id_trabajo}.zip", mime="application/zip")
+
+def mostrar_trabajo(id_trabajo):
+    progreso = cargar_gestor_trabajos().progreso(id_trabajo)
+    if not progreso:
+        st.warning(f"No se encontró el trabajo {id_trabajo}.")
+    elif progreso["estado"] == "terminado":
+        mostrar_trabajo_terminado(id_trabajo, progreso)
+    else:
+        mostrar_trabajo_en_curso(id_trabajo)
 
 # --- Pestaña Clasificador ---
 with pestana_clasificador:
@@ -405,9 +638,60 @@ with pestana_clasificador:
             st.metric("Recall", "70%", "2% desde la última versión")
         
         st.progress(0.73, text="Rendimiento del modelo")
+
+        # Versión activa del registro de modelos
+        estado_modelo = modelo.actual()
+        st.caption(f"Modelo activo: **{estado_modelo.version}** ({estado_modelo.metadata.get('origen', '')}, {estado_modelo.metadata.get('creado', '')})")
+        versiones = modelo.registro.listar()
+        version_elegida = st.selectbox("Versión del modelo", versiones, index=versiones.index(estado_modelo.version))
+        if st.button("Activar versión", disabled=version_elegida == estado_modelo.version):
+            # Se activa en el registro para que el resto de réplicas también la recarguen
+            modelo.registro.activar(version_elegida)
+            modelo.recargar_en_segundo_plano(version_elegida)
+            st.info(f"Cargando {version_elegida} en segundo plano...")
+        if modelo.ultimo_error:
+            st.error(modelo.ultimo_error)
         
-        # Selector de umbral de confianza
-        umbral_confianza = 73
+        # Calibración de la versión activa (temperatura + umbral de energía sobre validación)
+        if estado_modelo.calibracion:
+            cal = estado_modelo.calibracion
+            st.caption(f"Confianza calibrada: T = {cal['temperatura']:.2f}, error de calibración "
+                       f"{cal['ece_antes']:.1%} → {cal['ece_despues']:.1%}; confianza baja por debajo "
+                       f"de {calibracion.umbral_confianza(estado_modelo):.0f}%")
+        elif calibrador.estado["mensaje"]:
+            st.caption(calibrador.estado["mensaje"])
+
+        # Explicabilidad: mapa de calor de la última capa convolucional
+        mostrar_mapa = st.toggle("🔥 Mostrar mapa de calor (Grad-CAM)", value=False,
+                                 help="Muestra qué zonas de la imagen influyeron más en la predicción.")
+        
+        # Ubicación opcional para las estadísticas municipales
+        texto_ubicacion = st.text_input(
+            "📍 Ubicación (opcional)", placeholder="-17.3935, -66.1570",
+            help="Latitud y longitud. Solo se usa en las estadísticas agregadas para el municipio.",
+        )
+        ubicacion = leer_ubicacion(texto_ubicacion)
+        if texto_ubicacion and ubicacion == (None, None):
+            st.caption("⚠️ Formato no válido: se usará sin ubicación.")
+
+        # Estado del reentrenamiento con feedback
+        st.markdown("---")
+        st.subheader("🔁 Aprendizaje con feedback")
+        reentrenador = cargar_reentrenador()
+        st.caption(f"Correcciones pendientes: {max(0, reentrenador.pendientes())}")
+        if st.button("Reentrenar ahora", disabled=reentrenador.en_curso()):
+            reentrenador.lanzar()
+        estado = reentrenador.estado
+        if estado["mensaje"]:
+            st.caption(estado["mensaje"])
+        if estado["resultado"]:
+            res = estado["resultado"]
+            st.caption(f"Ajuste de la cabeza: {res['segundos_ajuste']:.1f} s")
+            if res["segundos_completo_estimado"]:
+                st.caption(
+                    f"Reentrenamiento completo estimado: {res['segundos_completo_estimado']:.0f} s "
+                    f"({res['segundos_completo_estimado'] / max(res['segundos_ajuste'], 1e-6):.0f}× más lento)"
+                )
         
         st.markdown("---")
         st.markdown("Desarrollado con **Keras, TensorFlow 🧠 y Streamlit**")
@@ -421,32 +705,62 @@ with pestana_clasificador:
                           horizontal=True)
     
     imagen_a_procesar = None
+    imagen_preview = None
     imagen_info_display = None
+    hash_imagen = None
+    archivo_entrada = None
     
     if input_method == "Subir imagen":
-        archivo_subido = st.file_uploader("Arrastra y suelta tu imagen aquí o haz clic para subir", 
+        archivo_entrada = st.file_uploader("Arrastra y suelta tu imagen aquí o haz clic para subir", 
                                         type=["jpg", "jpeg", "png", "webp"], 
-                                        key="file_uploader")
-        if archivo_subido:
-            imagen_a_procesar = Image.open(archivo_subido)
-            imagen_info_display = "🖼️ Imagen cargada desde archivo"
+                                        key="file_uploader",
+                                        max_upload_size=LIMITE_BYTES // (1024 * 1024))
+        imagen_info_display = "🖼️ Imagen cargada desde archivo"
     
     elif input_method == "Tomar foto con cámara":
-        foto_camara = st.camera_input("Toma una foto del residuo")
-        if foto_camara:
-            imagen_a_procesar = Image.open(foto_camara)
-            imagen_info_display = "📸 Foto tomada con cámara"
+        archivo_entrada = st.camera_input("Toma una foto del residuo")
+        imagen_info_display = "📸 Foto tomada con cámara"
     
-    # Mostrar imagen si está cargada
+    # Validar y decodificar (a escala reducida) antes de mostrar nada
+    if archivo_entrada:
+        datos_entrada = archivo_entrada.getvalue()
+        hash_imagen = hash_contenido(datos_entrada)
+        try:
+            imagen_a_procesar, imagen_preview = decodificar_entrada(hash_imagen, datos_entrada)
+        except ImagenRechazada as e:
+            st.error(f"⚠️ {e}")
+    
+    # Mostrar vista previa si la imagen está cargada (nunca el original completo)
     if imagen_a_procesar:
-        st.image(imagen_a_procesar, caption=imagen_info_display, use_column_width=True)
+        st.image(imagen_preview, caption=imagen_info_display, use_column_width=True)
 
         # Botón de clasificación
         st.markdown("---")
         if st.button("✨ ¡Clasificar Ahora! ✨", use_container_width=True):
             with st.spinner("Analizando la imagen..."):
                 # Clasificar la imagen
-                clase_predicha, confianza, tipo, pred = classify_image(imagen_a_procesar, modelo)
+                estado_prediccion = modelo.actual()
+                with medir("clasificacion"):
+                    clase_predicha, confianza, tipo, pred, embedding, mapa = classify_image(
+                        imagen_a_procesar, estado_prediccion, con_mapa=mostrar_mapa, hash_imagen=hash_imagen,
+                    )
+                # Umbral en la escala de la confianza de este estado (calibrada o no)
+                umbral_confianza = calibracion.umbral_confianza(estado_prediccion)
+                metricas.CLASIFICACIONES.inc(clase=clase_predicha)
+                if confianza < umbral_confianza:
+                    metricas.BAJA_CONFIANZA.inc()
+                almacen_eventos.registrar(clase_predicha, tipo, confianza, *ubicacion, origen="individual")
+                
+                # Guardar para el formulario de feedback
+                st.session_state["ultimo_resultado"] = {
+                    "hash": hash_imagen,
+                    "clase": clase_predicha,
+                    "indice_sugerido": int(np.argmax(pred)),
+                    "clases": estado_prediccion.clases,
+                    "confianza": confianza,
+                    "embedding": embedding,
+                    "version_base": estado_prediccion.version_base,
+                }
                 
                 # Actualizar contador
                 st.session_state["contador_clasificaciones"] += 1
@@ -457,119 +771,144 @@ with pestana_clasificador:
                     "confianza": confianza,
                     "tipo": tipo,
                     "fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
-                    "imagen": imagen_a_procesar
+                    "imagen": imagen_preview
                 }
                 st.session_state["historial"].append(registro)
                 
-                # Mostrar resultados
-                st.markdown(
-                    f"""
-                    <div class='result-box'>
-                        <h3>🔍 Resultado de la clasificación:</h3>
-                        <h2>Clase: {clase_predicha.upper()} {info_detalle_clase[clase_predicha]['icono']}</h2>
-                        <h4>Probabilidad: <strong style='color:#388e3c;'>{confianza:.2f}%</strong></h4>
-                        <h4>🧩 Tipo de residuo: <strong>{tipo}</strong> 
-                            <span class='badge {'badge-recyclable' if tipo == 'Reciclable' else 'badge-nonrecyclable'}'>
-                                {'♻️ Reciclable' if tipo == 'Reciclable' else '🗑️ No reciclable'}
-                            </span>
-                        </h4>
-                    </div>
-                    """,
-                    unsafe_allow_html=True,
-                )
+                # Lo no reconocido se muestra con su propia ficha en lugar de la de una clase
+                info_clase = info_detalle_clase.get(clase_predicha, info_no_reconocido)
+                if clase_predicha == CLASE_NO_RECONOCIDA:
+                    etiqueta_tipo = "❓ Sin clasificar"
+                else:
+                    etiqueta_tipo = '♻️ Reciclable' if tipo == 'Reciclable' else '🗑️ No reciclable'
+                
+                with medir("renderizado"):
+                    # Mostrar resultados
+                    st.markdown(
+                        f"""
+                        <div class='result-box'>
+                            <h3>🔍 Resultado de la clasificación:</h3>
+                            <h2>Clase: {clase_predicha.upper()} {info_clase['icono']}</h2>
+                            <h4>Probabilidad: <strong style='color:#388e3c;'>{confianza:.2f}%</strong></h4>
+                            <h4>🧩 Tipo de residuo: <strong>{tipo}</strong> 
+                                <span class='badge {'badge-recyclable' if tipo == 'Reciclable' else 'badge-nonrecyclable'}'>
+                                    {etiqueta_tipo}
+                                </span>
+                            </h4>
+                        </div>
+                        """,
+                        unsafe_allow_html=True,
+                    )
+                
+                    # Mapa de calor Grad-CAM
+                    if mapa is not None:
+                        st.image(cv2.cvtColor(anotar_imagen(imagen_preview, clase_predicha, confianza, mapa), cv2.COLOR_BGR2RGB),
+                                 caption=f"🔥 Zonas que más influyeron en la predicción (capa {obtener_explicador(modelo.actual()).capa})",
+                                 use_column_width=True)
+                        # Por imagen y solo pasadas reales: lotes y aciertos de caché no sesgan la comparación
+                        con_gradcam = metricas.LATENCIA_POR_IMAGEN.resumen(etapa="inferencia_gradcam")["media"]
+                        sin_gradcam = metricas.LATENCIA_POR_IMAGEN.resumen(etapa="inferencia")["media"]
+                        if con_gradcam and sin_gradcam:
+                            st.caption(f"Latencia media por imagen con Grad-CAM: {con_gradcam * 1000:.0f} ms, "
+                                       f"sin Grad-CAM: {sin_gradcam * 1000:.0f} ms "
+                                       f"(+{(con_gradcam - sin_gradcam) * 1000:.0f} ms)")
+                
+                    if clase_predicha == CLASE_NO_RECONOCIDA:
+                        st.info(f"🤔 La imagen no se parece lo suficiente a ninguna clase conocida. "
+                                f"Lo más parecido sería **{estado_prediccion.clases[int(np.argmax(pred))]}**.")
                 
-                # Mostrar confeti si la confianza es alta
-                if confianza > 90:
-                    show_confetti()
-                    st.balloons()
+                    # Mostrar confeti si la confianza es alta
+                    if confianza > 90 and clase_predicha != CLASE_NO_RECONOCIDA:
+                        show_confetti()
+                        st.balloons()
                 
-                # Información detallada en tarjeta
-                with st.expander(f"📌 Información detallada sobre {clase_predicha}", expanded=True):
-                    st.markdown(f"### {info_detalle_clase[clase_predicha]['icono']} {clase_predicha.capitalize()}")
-                    st.markdown(info_detalle_clase[clase_predicha]["descripcion"])
+                    # Información detallada en tarjeta
+                    with st.expander(f"📌 Información detallada sobre {clase_predicha}", expanded=True):
+                        st.markdown(f"### {info_clase['icono']} {clase_predicha.capitalize()}")
+                        st.markdown(info_clase["descripcion"])
                     
-                    st.markdown("**💡 Consejos importantes:**")
-                    for consejo in info_detalle_clase[clase_predicha]["consejos"]:
-                        st.markdown(f"- {consejo}")
+                        st.markdown("**💡 Consejos importantes:**")
+                        for consejo in info_clase["consejos"]:
+                            st.markdown(f"- {consejo}")
                     
-                    if tipo == "Reciclable":
-                        st.success("✅ Este material puede ser reciclado. Asegúrate de limpiarlo y depositarlo en el contenedor adecuado.")
-                    else:
-                        st.warning("⚠️ Este material no es reciclable. Deposítalo en el contenedor de basura general.")
+                        if tipo == "Reciclable":
+                            st.success("✅ Este material puede ser reciclado. Asegúrate de limpiarlo y depositarlo en el contenedor adecuado.")
+                        elif clase_predicha == CLASE_NO_RECONOCIDA:
+                            st.info("ℹ️ Si tienes dudas, consulta la guía de la pestaña de información educativa.")
+                        else:
+                            st.warning("⚠️ Este material no es reciclable. Deposítalo en el contenedor de basura general.")
                 
-                # Gráfico de barras interactivo
-                st.subheader("📊 Distribución de probabilidades")
+                    # Gráfico de barras interactivo
+                    st.subheader("📊 Distribución de probabilidades")
                 
-                # Crear dataframe para Plotly
-                import pandas as pd
-                df_pred = pd.DataFrame({
-                    "Clase": clases_residuos,
-                    "Probabilidad": pred,
-                    "Tipo": [tipo_residuo[clase] for clase in clases_residuos]
-                })
+                    # Crear dataframe para Plotly
+                    import pandas as pd
+                    df_pred = pd.DataFrame({
+                        "Clase": estado_prediccion.clases,
+                        "Probabilidad": pred,
+                        "Tipo": [tipo_residuo[clase] for clase in estado_prediccion.clases]
+                    })
                 
-                # Gráfico interactivo
-                fig = px.bar(df_pred, x="Clase", y="Probabilidad", color="Tipo",
-                            color_discrete_map={"Reciclable": "#4CAF50", "Inorgánico": "#F44336"},
-                            hover_data=["Probabilidad"],
-                            labels={"Probabilidad": "Probabilidad (%)", "Clase": "Categoría de residuo"},
-                            title="Confianza de predicción por categoría")
+                    # Gráfico interactivo
+                    fig = px.bar(df_pred, x="Clase", y="Probabilidad", color="Tipo",
+                                color_discrete_map={"Reciclable": "#4CAF50", "Inorgánico": "#F44336"},
+                                hover_data=["Probabilidad"],
+                                labels={"Probabilidad": "Probabilidad (%)", "Clase": "Categoría de residuo"},
+                                title="Confianza de predicción por categoría")
                 
-                fig.update_layout(yaxis_tickformat=".0%", yaxis_range=[0, 1])
-                st.plotly_chart(fig, use_container_width=True)
+                    fig.update_layout(yaxis_tickformat=".0%", yaxis_range=[0, 1])
+                    st.plotly_chart(fig, use_container_width=True)
                 
-                # Mostrar métricas de confianza
-                st.subheader("📈 Nivel de confianza")
-                st.markdown(f"""
-                    <div class="confidence-meter">
-                        <div class="confidence-label">Confianza:</div>
-                        <div class="progress-bar">
-                            <div class="progress-bar-fill" style="width: {confianza}%"></div>
+                    # Mostrar métricas de confianza
+                    st.subheader("📈 Nivel de confianza")
+                    st.markdown(f"""
+                        <div class="confidence-meter">
+                            <div class="confidence-label">Confianza:</div>
+                            <div class="progress-bar">
+                                <div class="progress-bar-fill" style="width: {confianza}%"></div>
+                            </div>
+                            <div class="confidence-value">{confianza:.1f}%</div>
                         </div>
-                        <div class="confidence-value">{confianza:.1f}%</div>
-                    </div>
-                """, unsafe_allow_html=True)
+                    """, unsafe_allow_html=True)
                 
-                if confianza < umbral_confianza:
-                    st.warning("⚠️ La confianza en esta predicción es baja. Considera verificar manualmente la clasificación.")
+                    if confianza < umbral_confianza:
+                        st.warning("⚠️ La confianza en esta predicción es baja. Considera verificar manualmente la clasificación.")
                 
-                # Calculadora de impacto ambiental
-                with st.expander("🌍 Calculadora de impacto ambiental"):
-                    st.markdown("""
-                        <div class="carbon-calculator">
-                            <h4>♻️ Impacto positivo potencial</h4>
-                            <p>Al reciclar correctamente este material, podrías estar contribuyendo a:</p>
-                    """, unsafe_allow_html=True)
+                    # Calculadora de impacto ambiental
+                    with st.expander("🌍 Calculadora de impacto ambiental"):
+                        st.markdown("""
+                            <div class="carbon-calculator">
+                                <h4>♻️ Impacto positivo potencial</h4>
+                                <p>Al reciclar correctamente este material, podrías estar contribuyendo a:</p>
+                        """, unsafe_allow_html=True)
                     
-                    if tipo == "Reciclable":
-                        beneficios = {
-                            "cartón": {"ahorro": "17 árboles", "energia": "4,000 kWh", "agua": "7,000 galones"},
-                            "vidrio": {"ahorro": "30% de energía", "emisiones": "20% menos CO2"},
-                            "metal": {"ahorro": "74% de energía", "recursos": "1.5 toneladas de mineral"},
-                            "papel": {"ahorro": "4,000 kWh", "agua": "7,000 galones", "arboles": "17 árboles"},
-                            "plástico": {"ahorro": "5.774 kWh", "petroleo": "16.3 barriles"}
-                        }
+                        if tipo == "Reciclable":
+                            # Misma tabla que los agregados del municipio (impacto.BENEFICIOS_POR_TONELADA)
+                            beneficios = describir_beneficios(clase_predicha)
                         
-                        if clase_predicha in beneficios:
-                            st.markdown("<ul>", unsafe_allow_html=True)
-                            for key, value in beneficios[clase_predicha].items():
-                                st.markdown(f"<li>Ahorrar <strong>{value}</strong> por tonelada reciclada</li>", unsafe_allow_html=True)
-                            st.markdown("</ul>", unsafe_allow_html=True)
+                            if beneficios:
+                                st.markdown("<ul>", unsafe_allow_html=True)
+                                for value in beneficios:
+                                    st.markdown(f"<li>Ahorrar <strong>{value}</strong> por tonelada reciclada</li>", unsafe_allow_html=True)
+                                st.markdown("</ul>", unsafe_allow_html=True)
                         
-                        st.markdown("""
-                            <div class="carbon-result">
-                                ¡Buen trabajo! Estás ayudando a reducir la huella de carbono.
-                            </div>
-                        """, unsafe_allow_html=True)
-                    else:
-                        st.markdown("""
-                            <p>Este material no es reciclable, pero al clasificarlo correctamente evitas que contamine otros materiales reciclables.</p>
-                            <div class="carbon-result">
-                                Considera reducir el consumo de este tipo de productos.
-                            </div>
-                        """, unsafe_allow_html=True)
+                            st.markdown("""
+                                <div class="carbon-result">
+                                    ¡Buen trabajo! Estás ayudando a reducir la huella de carbono.
+                                </div>
+                            """, unsafe_allow_html=True)
+                        elif clase_predicha == CLASE_NO_RECONOCIDA:
+                            st.markdown("<p>No se puede estimar el impacto de un objeto que no se ha reconocido.</p>",
+                                        unsafe_allow_html=True)
+                        else:
+                            st.markdown("""
+                                <p>Este material no es reciclable, pero al clasificarlo correctamente evitas que contamine otros materiales reciclables.</p>
+                                <div class="carbon-result">
+                                    Considera reducir el consumo de este tipo de productos.
+                                </div>
+                            """, unsafe_allow_html=True)
                     
-                    st.markdown("</div>", unsafe_allow_html=True)
+                        st.markdown("</div>", unsafe_allow_html=True)
                 
                 # Opciones de descarga
                 st.markdown("---")
@@ -586,39 +925,178 @@ with pestana_clasificador:
 - Fecha: {time.strftime("%Y-%m-%d %H:%M:%S")}
 
 Consejos:
-{info_detalle_clase[clase_predicha]["descripcion"]}
+{info_clase["descripcion"]}
 
-""" + "\n".join(f"- {c}" for c in info_detalle_clase[clase_predicha]["consejos"]),
+""" + "\n".join(f"- {c}" for c in info_clase["consejos"]),
         file_name=f"clasificacion_{clase_predicha}.txt",
         mime="text/plain",
     )
                 
                 with col_dl2:
-                    # Descargar imagen con anotación
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmpfile:
-                        # Crear imagen con anotación
-                        img_annotated = np.array(imagen_a_procesar.copy())
-                        img_annotated = cv2.cvtColor(img_annotated, cv2.COLOR_RGB2BGR)
-                        
-                        # Añadir texto
-                        text = f"{clase_predicha} ({confianza:.1f}%)"
-                        font = cv2.FONT_HERSHEY_SIMPLEX
-                        cv2.putText(img_annotated, text, (20, 50), font, 1, (0, 255, 0), 2, cv2.LINE_AA)
+                    with medir("exportacion"):
+                        # Descargar imagen con anotación
+                        with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmpfile:
+                            # Crear imagen con anotación
+                            img_annotated = anotar_imagen(imagen_a_procesar, clase_predicha, confianza, mapa)
                         
-                        # Guardar temporalmente
-                        cv2.imwrite(tmpfile.name, img_annotated)
+                            # Guardar temporalmente
+                            cv2.imwrite(tmpfile.name, img_annotated)
                         
-                        # Botón de descarga
-                        with open(tmpfile.name, "rb") as file:
-                            st.download_button(
-                                label="📷 Descargar imagen anotada",
-                                data=file,
-                                file_name=f"clasificado_{clase_predicha}.png",
-                                mime="image/png",
-                            )
+                            # Botón de descarga
+                            with open(tmpfile.name, "rb") as file:
+                                st.download_button(
+                                    label="📷 Descargar imagen anotada",
+                                    data=file,
+                                    file_name=f"clasificado_{clase_predicha}.png",
+                                    mime="image/png",
+                                )
                     
-                    # Eliminar archivo temporal
-                    os.unlink(tmpfile.name)
+                        # Eliminar archivo temporal
+                        os.unlink(tmpfile.name)
+
+        # --- Feedback sobre la clasificación ---
+        ultimo = st.session_state.get("ultimo_resultado")
+        if ultimo and ultimo["hash"] == hash_imagen:
+            st.markdown("---")
+            st.subheader("🗣️ ¿La clasificación fue correcta?")
+            with st.form("form_feedback"):
+                clase_corregida = st.selectbox(
+                    "Clase correcta del residuo:",
+                    ultimo["clases"],
+                    index=ultimo["indice_sugerido"],
+                )
+                if st.form_submit_button("Enviar feedback"):
+                    reentrenador = cargar_reentrenador()
+                    reentrenador.almacen.registrar(
+                        ultimo["hash"], ultimo["clase"], clase_corregida,
+                        ultimo["confianza"], ultimo["embedding"], ultimo["version_base"],
+                    )
+                    if reentrenador.lanzar_si_corresponde():
+                        st.info("🔁 Se alcanzó el número de correcciones necesario: reentrenamiento iniciado en segundo plano.")
+                    st.success("¡Gracias! Tu corrección nos ayuda a mejorar el modelo.")
+
+# --- Pestaña Lotes ---
+with pestana_lotes:
+    st.title("📦 Clasificación por lotes")
+    st.markdown(
+        """
+        Sube muchas imágenes a la vez: se procesan en segundo plano y puedes seguir usando la app.
+        El enlace de esta página conserva el trabajo, así que recargar el navegador no pierde nada.
+        """
+    )
+    
+    with st.form("form_lote", clear_on_submit=True):
+        archivos_lote = st.file_uploader("Selecciona las imágenes del lote",
+                                         type=["jpg", "jpeg", "png", "webp"],
+                                         accept_multiple_files=True,
+                                         max_upload_size=LIMITE_BYTES // (1024 * 1024))
+        lote_con_mapa = st.checkbox("Incluir mapas de calor (Grad-CAM) en las miniaturas")
+        enviar_lote = st.form_submit_button("🚀 Enviar lote", use_container_width=True)
+    
+    if enviar_lote and archivos_lote:
+        id_nuevo = cargar_gestor_trabajos().crear([(a.name, a.getvalue()) for a in archivos_lote], lote_con_mapa)
+        st.query_params["trabajo"] = id_nuevo
+    
+    # Trabajos anteriores (siguen disponibles tras recargar o desde otra sesión)
+    recientes = cargar_gestor_trabajos().recientes()
+    if recientes:
+        ids_recientes = [t["id"] for t in recientes]
+        id_actual = st.query_params.get("trabajo")
+        elegido = st.selectbox(
+            "Trabajos recientes",
+            ids_recientes,
+            index=ids_recientes.index(id_actual) if id_actual in ids_recientes else 0,
+            format_func=lambda i: next(f"{t['id']} · {t['creado']} · {t['total']} imágenes · {t['estado']}"
+                                       for t in recientes if t["id"] == i),
+            key=f"trabajos_recientes_{id_actual}",
+        )
+        if elegido != id_actual:
+            st.query_params["trabajo"] = elegido
+    
+    if st.query_params.get("trabajo"):
+        mostrar_trabajo(st.query_params["trabajo"])
+    else:
+        st.info("Aún no has enviado ningún lote.")
+
+# --- Pestaña Video ---
+with pestana_video:
+    st.title("🎬 Clasificación de videos de recorridos")
+    st.markdown(
+        """
+        Sube el video de una ruta de recolección. En lugar de clasificar cada fotograma, se toman muestras
+        solo cuando cambia la escena y se obtiene una **línea de tiempo** de materiales por segmento.
+        """
+    )
+    
+    # La subida de Streamlit guarda el video entero en memoria y no pasa de server.maxUploadSize:
+    # las grabaciones largas se dejan en DIRECTORIO_VIDEOS y se leen directamente del disco
+    origenes_video = ["Subir archivo"] + (["Carpeta del servidor"] if DIRECTORIO_VIDEOS else [])
+    origen_video = st.radio("Origen del video", origenes_video, horizontal=True) if len(origenes_video) > 1 else origenes_video[0]
+    archivo_video = ruta_video = None
+    if origen_video == "Subir archivo":
+        limite_subida = st.get_option("server.maxUploadSize")
+        archivo_video = st.file_uploader(f"Selecciona un video (hasta {limite_subida} MB)",
+                                         type=["mp4", "avi", "mov", "mkv"], key="video_uploader")
+        if not DIRECTORIO_VIDEOS:
+            st.caption("Para videos más grandes, el administrador puede configurar una carpeta del servidor (DIRECTORIO_VIDEOS).")
+    else:
+        videos_servidor = listar_videos(DIRECTORIO_VIDEOS)
+        if videos_servidor:
+            ruta_video = st.selectbox("Video", videos_servidor, format_func=os.path.basename)
+        else:
+            st.info(f"No hay videos en '{DIRECTORIO_VIDEOS}'.")
+    
+    if (archivo_video or ruta_video) and st.button("🎞️ Analizar video", use_container_width=True):
+        if archivo_video:
+            # VideoCapture necesita una ruta: se copia a disco por bloques
+            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(archivo_video.name)[1]) as tmpvideo:
+                shutil.copyfileobj(archivo_video, tmpvideo)
+            ruta_video = tmpvideo.name
+        
+        barra_video = st.progress(0.0, text="Analizando video...")
+        try:
+            with medir("video"):
+                resultado_video = analizar_video(
+                    ruta_video,
+                    lambda imagenes: classify_batch(imagenes, modelo),
+                    progreso=lambda fraccion: barra_video.progress(fraccion, text=f"Analizando video... {fraccion:.0%}"),
+                )
+            st.session_state["resultado_video"] = resultado_video
+            # Para el municipio cuenta cada segmento (un objeto a la vista), no cada fotograma muestreado
+            for seg in resultado_video["segmentos"]:
+                almacen_eventos.registrar(seg["clase"], tipo_residuo.get(seg["clase"], "Desconocido"),
+                                          seg["confianza"], origen="video")
+        except ValueError as e:
+            st.error(f"⚠️ {e}")
+        finally:
+            if archivo_video:
+                os.unlink(ruta_video)
+    
+    resultado_video = st.session_state.get("resultado_video")
+    if resultado_video:
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Duración", f"{resultado_video['duracion'] / 60:.1f} min")
+        col2.metric("Fotogramas clasificados", f"{resultado_video['muestreados']} de {resultado_video['fotogramas']}")
+        col3.metric("Velocidad", f"{resultado_video['velocidad']:.1f}× tiempo real")
+        
+        # Línea de tiempo por segmento
+        import pandas as pd
+        df_segmentos = pd.DataFrame([
+            {"Material": seg["clase"], "Inicio (s)": seg["inicio"], "Duración (s)": max(seg["fin"] - seg["inicio"], 0.5),
+             "Muestras": seg["muestras"], "Confianza media (%)": round(seg["confianza"], 1),
+             "Tipo": tipo_residuo.get(seg["clase"], "Desconocido")}
+            for seg in resultado_video["segmentos"]
+        ])
+        if not df_segmentos.empty:
+            fig = px.bar(df_segmentos, x="Duración (s)", y="Material", base="Inicio (s)", orientation="h",
+                         color="Tipo", color_discrete_map={"Reciclable": "#4CAF50", "Inorgánico": "#F44336"},
+                         hover_data=["Muestras", "Confianza media (%)"], title="Línea de tiempo de materiales")
+            fig.update_xaxes(title="Tiempo (s)")
+            st.plotly_chart(fig, use_container_width=True)
+            st.dataframe(df_segmentos, use_container_width=True)
+        
+        st.subheader("📊 Conteo por material")
+        st.bar_chart(resultado_video["conteos"])
 
 # --- Pestaña Información Educativa ---
 with pestana_info:
@@ -886,4 +1364,75 @@ with pestana_about:
         <p>Cada pequeña acción cuenta. ¡Gracias por ser parte del cambio!</p>
     </div>
     """, unsafe_allow_html=True)
-    
\ No newline at end of file
+    
+
+# --- Pestaña Admin (oculta) ---
+if modo_admin:
+    with pestanas[7]:
+        st.title("🛠️ Métricas de producción")
+
+        # Latencia media por etapa
+        filas = []
+        for etapa in ["decodificacion", "preprocesamiento", "inferencia", "inferencia_gradcam",
+                      "calibracion", "clasificacion", "renderizado", "exportacion", "video",
+                      "consulta_municipal"]:
+            resumen = metricas.LATENCIA_ETAPA.resumen(etapa=etapa)
+            por_imagen = metricas.LATENCIA_POR_IMAGEN.resumen(etapa=etapa)
+            filas.append({"Etapa": etapa, "Llamadas": resumen["cuenta"], "Media (ms)": resumen["media"] * 1000,
+                          "Por imagen (ms)": por_imagen["media"] * 1000 if por_imagen["cuenta"] else None})
+        st.dataframe(filas, use_container_width=True)
+
+        # Coste de medir una etapa frente a la inferencia media
+        sobrecarga, escritura_span = metricas.medir_sobrecarga()
+        inferencia = metricas.LATENCIA_ETAPA.resumen(etapa="inferencia")["media"]
+        texto = f"Sobrecarga de la instrumentación: {sobrecarga * 1e6:.2f} µs por etapa medida"
+        if inferencia:
+            texto += f" ({sobrecarga / inferencia:.4%} de una inferencia)"
+        if escritura_span is not None:
+            texto += (f", incluido el encolado del span; convertirlo a OTLP y escribirlo cuesta "
+                      f"{escritura_span * 1e6:.2f} µs más en el hilo exportador")
+        st.caption(texto)
+        if metricas.exportador_spans is not None and metricas.exportador_spans.ultimo_error:
+            st.error(metricas.exportador_spans.ultimo_error)
+
+        st.subheader("Exposición Prometheus")
+        st.code(metricas.registro.exposicion(), language="text")
+
+        # Exportación para los sistemas municipales de reciclaje
+        st.subheader("🏙️ Exportación municipal")
+        if st.button("Actualizar agregados ahora"):
+            with st.spinner("Compactando eventos y recalculando los días con cambios..."):
+                dias_actualizados = almacen_eventos.mantenimiento()
+            st.caption(f"Días actualizados: {len(dias_actualizados)}")
+        if almacen_eventos.ultimo_error:
+            st.error(almacen_eventos.ultimo_error)
+        
+        rango = almacen_eventos.rango_fechas()
+        if rango:
+            import datetime
+            primera, ultima = (datetime.date.fromisoformat(fecha) for fecha in rango)
+            periodo = st.date_input("Periodo", value=(primera, ultima), min_value=primera, max_value=ultima)
+            if len(periodo) == 2:
+                desde, hasta = (fecha.isoformat() for fecha in periodo)
+                with medir("consulta_municipal"):
+                    por_material = almacen_eventos.consultar(desde, hasta)
+                if por_material is not None:
+                    df_material = por_material.to_pandas().sort_values("toneladas", ascending=False)
+                    st.caption("Toneladas equivalentes estimadas a partir del peso medio de cada material; "
+                               "beneficios con las cifras por tonelada de la calculadora de impacto.")
+                    st.dataframe(df_material, use_container_width=True)
+                    st.plotly_chart(px.bar(df_material, x="clase", y="toneladas", color="tipo_residuo",
+                                           color_discrete_map={"Reciclable": "#4CAF50", "Inorgánico": "#F44336"},
+                                           title="Toneladas equivalentes por material"),
+                                    use_container_width=True)
+                    
+                    # Agregados diarios por material y celda (~1 km), listos para el tablero del municipio
+                    diarios = almacen_eventos.consultar(desde, hasta, por=None)
+                    col_csv, col_parquet = st.columns(2)
+                    col_csv.download_button("📥 Agregados diarios (CSV)", diarios.to_pandas().to_csv(index=False),
+                                            file_name=f"residuos_{desde}_{hasta}.csv", mime="text/csv")
+                    col_parquet.download_button("📥 Agregados diarios (Parquet)", almacen_eventos.a_parquet(diarios),
+                                                file_name=f"residuos_{desde}_{hasta}.parquet",
+                                                mime="application/octet-stream")
+        else:
+            st.info("Aún no hay agregados: se calculan cada pocos minutos o con el botón de arriba.")
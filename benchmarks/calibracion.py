@@ -0,0 +1,86 @@
+# --- Benchmark de la calibración ---
+# Uso: python benchmarks/calibracion.py [--cache feedback/cache/val_v0001.npz --modelo modelos/v0001/modelo.keras]
+# Mide el ajuste (temperatura + umbral de energía) sobre embeddings de validación ya cacheados y el coste
+# de aplicarlo en cada predicción. Sin --cache usa embeddings sintéticos del tamaño del split de validación
+# del notebook, con una cabeza deliberadamente sobreconfiada y un conjunto "fuera de distribución".
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from calibracion import UMBRAL_CONFIANZA_SIN_CALIBRAR, aplicar, calibrar, logits_cabeza, puntuacion_energia, softmax
+
+
+class _Estado:
+    def __init__(self, cabeza, calibracion=None):
+        self.cabeza = cabeza
+        self.calibracion = calibracion
+
+
+def datos_sinteticos(n=380, dimension=128, clases=6):
+    rng = np.random.default_rng(0)
+    centros = rng.normal(0, 0.2, (clases, dimension))
+    y = rng.integers(0, clases, n)
+    # Embeddings tras ReLU, con mucho solapamiento entre clases
+    X = np.maximum(centros[y] + rng.normal(0, 1.0, (n, dimension)), 0).astype(np.float32)
+    # Cabeza "entrenada" con pesos escalados: acierta lo mismo pero con probabilidades demasiado altas
+    W = (centros.T * 6).astype(np.float32)
+    b = np.zeros(clases, dtype=np.float32)
+    # Fuera de distribución: activaciones débiles y sin estructura de clase
+    X_ood = np.maximum(rng.normal(0, 0.5, (n, dimension)), 0).astype(np.float32)
+    return (W, b), X, y, X_ood
+
+
+def datos_reales(ruta_cache, ruta_modelo):
+    import tensorflow as tf
+    datos = np.load(ruta_cache)
+    cabeza = [np.asarray(p) for p in tf.keras.models.load_model(ruta_modelo).layers[-1].get_weights()]
+    return cabeza, datos["X"], datos["y"], None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cache")
+    parser.add_argument("--modelo")
+    args = parser.parse_args()
+
+    cabeza, X, y, X_ood = datos_reales(args.cache, args.modelo) if args.cache else datos_sinteticos()
+    inicio = time.perf_counter()
+    calibracion = calibrar(cabeza, X, y)
+    segundos = time.perf_counter() - inicio
+
+    logits = logits_cabeza(cabeza, X)
+    precision = np.mean(np.argmax(logits, axis=1) == y)
+    print(f"Validación: {len(y)} embeddings de dimensión {X.shape[1]}, precisión {precision:.1%}")
+    print(f"Ajuste: {segundos * 1000:.1f} ms → T = {calibracion['temperatura']:.2f}, "
+          f"NLL {calibracion['nll_antes']:.3f} → {calibracion['nll_despues']:.3f}, "
+          f"ECE {calibracion['ece_antes']:.1%} → {calibracion['ece_despues']:.1%}")
+    print(f"Confianza media: {np.max(softmax(logits), axis=1).mean():.1%} sin calibrar, "
+          f"{np.max(softmax(logits, calibracion['temperatura']), axis=1).mean():.1%} calibrada")
+    print(f"Umbral de energía: {calibracion['umbral_energia']:.2f} "
+          f"(rechaza {calibracion['tasa_rechazo_val']:.1%} de validación)")
+    confianza_calibrada = np.max(softmax(logits, calibracion["temperatura"]), axis=1) * 100
+    print(f"Umbral de confianza baja: {UMBRAL_CONFIANZA_SIN_CALIBRAR}% sin calibrar → "
+          f"{calibracion['umbral_confianza']:.1f}% calibrada (avisa en {calibracion['tasa_confianza_baja_val']:.1%} "
+          f"de validación; el {UMBRAL_CONFIANZA_SIN_CALIBRAR}% fijo sobre la calibrada avisaría en "
+          f"{np.mean(confianza_calibrada < UMBRAL_CONFIANZA_SIN_CALIBRAR):.1%})")
+    if X_ood is not None:
+        rechazo_ood = np.mean(puntuacion_energia(logits_cabeza(cabeza, X_ood)) < calibracion["umbral_energia"])
+        print(f"Rechazo fuera de distribución (sintético): {rechazo_ood:.1%}")
+
+    # Coste por predicción en el camino de inferencia (una imagen)
+    estado = _Estado(cabeza, calibracion)
+    embedding = X[:1]
+    repeticiones = 20_000
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        aplicar(estado, embedding)
+    print(f"aplicar(): {(time.perf_counter() - inicio) / repeticiones * 1e6:.1f} µs por imagen")
+
+
+if __name__ == "__main__":
+    main()
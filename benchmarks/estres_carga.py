@@ -0,0 +1,112 @@
+# --- Prueba de estrés del pipeline de carga de imágenes ---
+# Uso: python benchmarks/estres_carga.py
+# Cada caso corre en un proceso nuevo para medir su pico de memoria (RSS) por separado (Linux).
+import multiprocessing
+import os
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from carga_imagenes import ImagenRechazada, cargar_imagen
+
+
+def _bytes_imagen(ancho, alto, formato, **opciones):
+    rng = np.random.default_rng(0)
+    # Ruido suave: comprime como una foto real, no como un color plano
+    base = rng.integers(0, 255, (alto // 16 + 1, ancho // 16 + 1, 3), dtype=np.uint8)
+    img = Image.fromarray(base).resize((ancho, alto), Image.Resampling.BILINEAR)
+    buffer = BytesIO()
+    img.save(buffer, formato, **opciones)
+    return buffer.getvalue()
+
+
+def _bomba_png(ancho, alto):
+    # Cabecera PNG válida que declara dimensiones gigantes con muy pocos bytes de datos
+    def bloque(tipo, datos):
+        return struct.pack(">I", len(datos)) + tipo + datos + struct.pack(">I", zlib.crc32(tipo + datos))
+    ihdr = struct.pack(">IIBBBBB", ancho, alto, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + bloque(b"IHDR", ihdr) + bloque(b"IDAT", zlib.compress(b"\x00" * 1024)) + bloque(b"IEND", b"")
+
+
+def _png_plano(ancho, alto):
+    # Color plano: pocos bytes en disco pero 50 MP al decodificar
+    buffer = BytesIO()
+    Image.new("RGB", (ancho, alto), (90, 140, 60)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _jpeg_con_orientacion():
+    img = Image.new("RGB", (400, 200), (200, 30, 30))
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotado 90°
+    exif[0x010F] = "Camara de prueba"
+    buffer = BytesIO()
+    img.save(buffer, "JPEG", exif=exif)
+    return buffer.getvalue()
+
+
+CASOS = {
+    "jpeg_12mp": lambda: _bytes_imagen(4000, 3000, "JPEG", quality=90),
+    "jpeg_36mp": lambda: _bytes_imagen(7000, 5100, "JPEG", quality=90),
+    "png_12mp": lambda: _bytes_imagen(4000, 3000, "PNG"),
+    "png_50mp_excede_bytes": lambda: _bytes_imagen(8200, 6100, "PNG", compress_level=1),
+    "png_50mp_plano": lambda: _png_plano(8200, 6100),
+    "bomba_png": lambda: _bomba_png(60000, 60000),
+    "jpeg_truncado": lambda: _bytes_imagen(3000, 2000, "JPEG")[:50000],
+    "basura_binaria": lambda: os.urandom(200_000),
+    "jpeg_exif_orientado": _jpeg_con_orientacion,
+}
+
+
+def _memoria_kb(campo):
+    with open("/proc/self/status", encoding="ascii") as f:
+        for linea in f:
+            if linea.startswith(campo + ":"):
+                return int(linea.split()[1])
+    return 0
+
+
+def _ejecutar_caso(ruta, cola):
+    with open(ruta, "rb") as f:
+        datos = f.read()
+    # Reinicia el pico de memoria (VmHWM) para medir solo la carga
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    rss_base = _memoria_kb("VmRSS")
+    inicio = time.perf_counter()
+    try:
+        img, preview = cargar_imagen(datos)
+        resultado = f"ok {img.size} preview {preview.size} exif={'exif' in img.info}"
+    except ImagenRechazada as e:
+        resultado = f"rechazada: {e}"
+    segundos = time.perf_counter() - inicio
+    rss_pico = _memoria_kb("VmHWM")
+    cola.put((len(datos), segundos, (rss_pico - rss_base) / 1024, resultado))
+
+
+def main():
+    contexto = multiprocessing.get_context("spawn")
+    print(f"{'caso':<24}{'bytes':>12}{'ms':>10}{'+RSS MB':>10}  resultado")
+    for nombre, generar in CASOS.items():
+        # Los datos se generan aquí para que el pico del proceso hijo sea solo el de la carga
+        with tempfile.NamedTemporaryFile(delete=False) as tmp:
+            tmp.write(generar())
+        cola = contexto.Queue()
+        proceso = contexto.Process(target=_ejecutar_caso, args=(tmp.name, cola))
+        proceso.start()
+        tamano, segundos, rss_mb, resultado = cola.get()
+        proceso.join()
+        os.unlink(tmp.name)
+        print(f"{nombre:<24}{tamano:>12}{segundos * 1000:>10.1f}{rss_mb:>10.1f}  {resultado}")
+
+
+if __name__ == "__main__":
+    main()
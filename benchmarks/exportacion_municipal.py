@@ -0,0 +1,107 @@
+# --- Benchmark de la exportación municipal ---
+# Uso: python benchmarks/exportacion_municipal.py [--eventos 10000000] [--dias 365]
+# Escribe eventos sintéticos en orden cronológico (como llegarían de la app), compacta y agrega,
+# y compara el tiempo de consulta de los agregados frente a recorrer los eventos en bruto.
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pyarrow.dataset as ds
+
+from exportacion_municipal import EVENTOS_POR_ARCHIVO, AlmacenEventos, _dia
+
+CLASES = ['cartón', 'vidrio', 'metal', 'papel', 'plástico', 'basura']
+TIPOS = ['Reciclable'] * 5 + ['Inorgánico']
+INICIO_MS = 1_704_067_200_000  # 2024-01-01 UTC
+
+
+def generar_bloque(rng, desde, cantidad, total, dias):
+    # Eventos repartidos uniformemente en el periodo; un 30 % sin ubicación
+    instantes = INICIO_MS + (np.arange(desde, desde + cantidad) * (dias * 86_400_000 // total))
+    indices = rng.integers(0, len(CLASES), cantidad)
+    con_ubicacion = rng.random(cantidad) < 0.7
+    latitud = np.where(con_ubicacion, -17.40 + rng.random(cantidad) * 0.1, np.nan)
+    longitud = np.where(con_ubicacion, -66.20 + rng.random(cantidad) * 0.1, np.nan)
+    return {
+        "fecha_hora": instantes,
+        "clase": np.array(CLASES, dtype=object)[indices],
+        "tipo_residuo": np.array(TIPOS, dtype=object)[indices],
+        "confianza": rng.uniform(40, 100, cantidad).astype(np.float32),
+        "latitud": latitud,
+        "longitud": longitud,
+        "origen": np.full(cantidad, "lote", dtype=object),
+    }
+
+
+def tamano_mb(directorio):
+    return sum(os.path.getsize(os.path.join(raiz, f)) for raiz, _, archivos in os.walk(directorio)
+               for f in archivos) / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--eventos", type=int, default=10_000_000)
+    parser.add_argument("--dias", type=int, default=365)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as directorio:
+        almacen = AlmacenEventos(directorio)
+
+        # Escritura: bloques del tamaño de un vaciado, como los produce la app en funcionamiento
+        segundos_generacion = 0.0
+        inicio = time.perf_counter()
+        for desde in range(0, args.eventos, EVENTOS_POR_ARCHIVO):
+            t = time.perf_counter()
+            bloque = generar_bloque(rng, desde, min(EVENTOS_POR_ARCHIVO, args.eventos - desde), args.eventos, args.dias)
+            segundos_generacion += time.perf_counter() - t
+            almacen.registrar_lote(bloque)
+        almacen.vaciar()
+        segundos_escritura = time.perf_counter() - inicio - segundos_generacion
+        partes = sum(len(f) for _, _, f in os.walk(almacen.dir_eventos))
+        print(f"Escritura: {args.eventos:,} eventos en {segundos_escritura:.1f} s "
+              f"({args.eventos / segundos_escritura:,.0f} eventos/s), {partes} partes, "
+              f"{tamano_mb(almacen.dir_eventos):.0f} MB")
+
+        # Registro evento a evento (el camino de la clasificación individual)
+        inicio = time.perf_counter()
+        for i in range(100_000):
+            almacen.registrar("papel", "Reciclable", 80.0, instante=INICIO_MS / 1000 + i)
+        almacen.vaciar()
+        print(f"registrar() individual: {(time.perf_counter() - inicio) / 100_000 * 1e6:.1f} µs por evento")
+
+        # Compactación y agregados de todos los días
+        inicio = time.perf_counter()
+        dias = almacen.mantenimiento()
+        print(f"Mantenimiento inicial: {len(dias)} días en {time.perf_counter() - inicio:.1f} s, "
+              f"agregados: {tamano_mb(almacen.dir_agregados):.1f} MB")
+
+        # Incremental: un día nuevo de eventos solo recompacta y reagrega ese día
+        almacen.registrar_lote(generar_bloque(rng, 0, 30_000, args.eventos, 1))
+        inicio = time.perf_counter()
+        dias = almacen.mantenimiento()
+        print(f"Mantenimiento incremental: {len(dias)} día(s) en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+        # Consultas de un semestre: agregados frente a eventos en bruto
+        desde, hasta = _dia(INICIO_MS // 86_400_000), _dia(INICIO_MS // 86_400_000 + min(args.dias, 182) - 1)
+        inicio = time.perf_counter()
+        resultado = almacen.consultar(desde, hasta)
+        segundos_agregados = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        crudo = ds.dataset(almacen.dir_eventos, format="parquet", partitioning="hive").to_table(
+            columns=["clase", "confianza"], filter=(ds.field("fecha") >= desde) & (ds.field("fecha") <= hasta),
+        ).group_by("clase").aggregate([("confianza", "count")])
+        segundos_crudo = time.perf_counter() - inicio
+        assert sorted(resultado["eventos"].to_pylist()) == sorted(crudo["confianza_count"].to_pylist())
+        print(f"Consulta {desde} → {hasta}: agregados {segundos_agregados * 1000:.0f} ms, "
+              f"eventos en bruto {segundos_crudo * 1000:.0f} ms ({segundos_crudo / segundos_agregados:.0f}× más lento)")
+        print(resultado.select(["clase", "eventos", "toneladas", "energia_kwh", "arboles"]).to_pandas().to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
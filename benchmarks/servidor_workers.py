@@ -0,0 +1,103 @@
+# --- Benchmark del servicio multiproceso ---
+# Uso: python benchmarks/servidor_workers.py [--peticiones 400] [--clientes 16]
+# Construye la arquitectura del notebook con pesos aleatorios (mismo coste que el modelo real),
+# la exporta a TFLite y mide rendimiento y memoria total con 1, 2, 4 y 8 workers (Linux). La memoria
+# incluye el forkserver del que nacen los workers: sus páginas son las que los workers comparten.
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from servidor_workers import ServidorWorkers
+
+
+def crear_tflite(directorio):
+    import tensorflow as tf
+    from tensorflow.keras import layers, models
+
+    modelo = models.Sequential([
+        layers.Input(shape=(224, 224, 3)),
+        layers.Conv2D(32, (3, 3), activation='relu'),
+        layers.MaxPooling2D(2, 2),
+        layers.Conv2D(64, (3, 3), activation='relu'),
+        layers.MaxPooling2D(2, 2),
+        layers.Conv2D(128, (3, 3), activation='relu'),
+        layers.MaxPooling2D(2, 2),
+        layers.Flatten(),
+        layers.Dense(128, activation='relu'),
+        layers.Dropout(0.5),
+        layers.Dense(6, activation='softmax'),
+    ])
+    extractor = tf.keras.Model(modelo.inputs, [modelo.layers[-2].output, modelo.outputs[0]])
+    ruta = os.path.join(directorio, "modelo.tflite")
+    with open(ruta, "wb") as f:
+        f.write(tf.lite.TFLiteConverter.from_keras_model(extractor).convert())
+    return ruta
+
+
+def memoria_kb(pid):
+    # RSS cuenta las páginas compartidas en cada proceso; PSS las reparte, así que su suma es la memoria real
+    rss = pss = 0
+    with open(f"/proc/{pid}/status", encoding="ascii") as f:
+        for linea in f:
+            if linea.startswith("VmRSS:"):
+                rss = int(linea.split()[1])
+    with open(f"/proc/{pid}/smaps_rollup", encoding="ascii") as f:
+        for linea in f:
+            if linea.startswith("Pss:"):
+                pss = int(linea.split()[1])
+    return rss, pss
+
+
+def padre(pid):
+    with open(f"/proc/{pid}/stat", encoding="ascii") as f:
+        return int(f.read().rsplit(")", 1)[1].split()[1])
+
+
+def medir(ruta, num_workers, peticiones, clientes):
+    servidor = ServidorWorkers(ruta, num_workers=num_workers)
+    lote = np.random.default_rng(0).random((1, 224, 224, 3), dtype=np.float32)
+
+    # Calentamiento: espera a que todos los workers hayan cargado el intérprete
+    with ThreadPoolExecutor(clientes) as pool:
+        list(pool.map(lambda _: servidor.clasificar(lote), range(num_workers * 4)))
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(clientes) as pool:
+        list(pool.map(lambda _: servidor.clasificar(lote), range(peticiones)))
+    segundos = time.perf_counter() - inicio
+
+    pids = servidor.pids()
+    # El padre de los workers, si no es este proceso, es el forkserver
+    pids += {padre(pid) for pid in pids} - {os.getpid()}
+    memorias = [memoria_kb(pid) for pid in pids]
+    servidor.detener()
+    return peticiones / segundos, sum(m[0] for m in memorias) / 1024, sum(m[1] for m in memorias) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--peticiones", type=int, default=400)
+    parser.add_argument("--clientes", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = crear_tflite(directorio)
+        print(f"Modelo TFLite: {os.path.getsize(ruta) / 1024 / 1024:.1f} MB, CPUs: {os.cpu_count()}")
+        print(f"{'workers':>8}{'img/s':>10}{'RSS total MB':>15}{'PSS total MB':>15}{'PSS extra/worker':>18}")
+        anterior = None
+        for num_workers in (1, 2, 4, 8):
+            rendimiento, rss, pss = medir(ruta, num_workers, args.peticiones, args.clientes)
+            extra = f"{(pss - anterior[1]) / (num_workers - anterior[0]):.0f}" if anterior else "-"
+            print(f"{num_workers:>8}{rendimiento:>10.1f}{rss:>15.0f}{pss:>15.0f}{extra:>18}")
+            anterior = (num_workers, pss)
+
+
+if __name__ == "__main__":
+    main()
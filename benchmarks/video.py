@@ -0,0 +1,117 @@
+# --- Benchmark del análisis de video ---
+# Uso: python benchmarks/video.py [--minutos 10] [--video grabacion.mp4] [--modelo modelos/v0001/modelo.keras]
+# Genera un video sintético con cambios de escena y mide la velocidad respecto al tiempo real
+# y el pico de memoria (Linux). Sin --modelo usa un clasificador trivial para medir solo decodificación y muestreo.
+# Mide los dos caminos de la app: la carpeta del servidor (se lee del disco) y la subida, donde Streamlit
+# guarda el archivo entero en memoria (UploadedFile es un BytesIO) y la app lo copia a disco antes de analizarlo.
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+from video import analizar_video
+
+CLASES = ['cartón', 'vidrio', 'metal', 'papel', 'plástico', 'basura']
+
+
+def generar_video(ruta, minutos, fps=25, tamano=(1280, 720)):
+    escritor = cv2.VideoWriter(ruta, cv2.VideoWriter_fourcc(*"mp4v"), fps, tamano)
+    rng = np.random.default_rng(0)
+    fondo = None
+    for indice in range(int(minutos * 60 * fps)):
+        # Una escena nueva cada ~8 s, con un objeto en movimiento dentro de cada escena
+        if indice % (8 * fps) == 0:
+            fondo = np.full((tamano[1], tamano[0], 3), rng.integers(0, 255, 3), dtype=np.uint8)
+        fotograma = fondo.copy()
+        x = 100 + (indice * 7) % (tamano[0] - 300)
+        # Objeto con textura nueva en cada fotograma: sin ella el video comprime muy por debajo de una cámara real
+        fotograma[300:500, x:x + 200] = rng.integers(128, 256, (200, 200, 3), dtype=np.uint8)
+        escritor.write(fotograma)
+    escritor.release()
+
+
+def clasificador_trivial(imagenes):
+    return [(CLASES[int(np.asarray(img).mean()) % len(CLASES)], 80.0, "") for img in imagenes]
+
+
+def clasificador_keras(ruta_modelo):
+    import tensorflow as tf
+    modelo = tf.keras.models.load_model(ruta_modelo)
+
+    def clasificar(imagenes):
+        lote = np.stack([np.asarray(img.resize((224, 224)), dtype=np.float32) / 255.0 for img in imagenes])
+        pred = modelo(lote, training=False).numpy()
+        return [(CLASES[int(np.argmax(p))], float(np.max(p)) * 100, "") for p in pred]
+    return clasificar
+
+
+def pico_memoria_mb():
+    with open("/proc/self/status", encoding="ascii") as f:
+        for linea in f:
+            if linea.startswith("VmHWM:"):
+                return int(linea.split()[1]) / 1024
+    return 0.0
+
+
+def reiniciar_pico():
+    # Reinicia el pico (VmHWM) para que cuente solo lo que viene después
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    return pico_memoria_mb()
+
+
+def desde_subida(ruta, clasificar):
+    # Lo que hace la pestaña Video con un archivo subido
+    with open(ruta, "rb") as f:
+        archivo_subido = io.BytesIO(f.read())
+    inicio = time.perf_counter()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tmpvideo:
+        shutil.copyfileobj(archivo_subido, tmpvideo)
+    segundos_copia = time.perf_counter() - inicio
+    try:
+        return analizar_video(tmpvideo.name, clasificar), segundos_copia
+    finally:
+        os.unlink(tmpvideo.name)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutos", type=float, default=10)
+    parser.add_argument("--video", help="video real en lugar del sintético")
+    parser.add_argument("--modelo")
+    args = parser.parse_args()
+
+    clasificar = clasificador_keras(args.modelo) if args.modelo else clasificador_trivial
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = args.video or os.path.join(directorio, "sintetico.mp4")
+        if not args.video:
+            generar_video(ruta, args.minutos)
+        megas = os.path.getsize(ruta) / 1024 / 1024
+
+        memoria_inicial = reiniciar_pico()
+        resultado = analizar_video(ruta, clasificar)
+        pico_servidor = pico_memoria_mb()
+
+        memoria_subida = reiniciar_pico()
+        _, segundos_copia = desde_subida(ruta, clasificar)
+        pico_subida = pico_memoria_mb()
+
+    print(f"Video: {megas:.0f} MB, duración: {resultado['duracion']:.0f} s, fotogramas: {resultado['fotogramas']}, "
+          f"muestreados: {resultado['muestreados']} ({resultado['muestreados'] / resultado['fotogramas']:.2%})")
+    print(f"Tiempo de proceso: {resultado['segundos_proceso']:.1f} s → {resultado['velocidad']:.1f}× tiempo real")
+    print(f"Segmentos: {len(resultado['segmentos'])}, conteos: {resultado['conteos']}")
+    print(f"Pico de memoria desde la carpeta del servidor: {memoria_inicial:.0f} MB antes, {pico_servidor:.0f} MB después")
+    print(f"Pico de memoria desde la subida: {memoria_subida:.0f} MB antes, {pico_subida:.0f} MB después "
+          f"(copia a disco: {segundos_copia:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
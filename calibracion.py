@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from feedback import DIRECTORIO_FEEDBACK, embeddings_split
+
+# --- Configuración ---
+DIRECTORIO_VAL = os.path.join("Classification", "val")
+CLASE_NO_RECONOCIDA = "no reconocido"
+# Fracción de imágenes de validación (todas de clases conocidas) que se acepta rechazar al fijar el umbral
+TASA_RECHAZO_VAL = 0.05
+# Umbral de "confianza baja" (en %) pensado para la softmax sin calibrar; se usa tal cual si no hay calibración
+UMBRAL_CONFIANZA_SIN_CALIBRAR = 73
+CUBETAS_ECE = 15
+LIMITES_TEMPERATURA = (0.05, 20.0)
+ITERACIONES_BUSQUEDA = 60
+
+
+# --- Logits a partir del embedding (la cabeza es una Dense: basta un producto de matrices) ---
+def logits_cabeza(pesos, X):
+    W, b = pesos
+    return np.asarray(X, dtype=np.float32) @ W + b
+
+
+def _logsumexp(z):
+    maximo = np.max(z, axis=1, keepdims=True)
+    return (maximo + np.log(np.sum(np.exp(z - maximo), axis=1, keepdims=True)))[:, 0]
+
+
+def softmax(z, temperatura=1.0):
+    z = z / temperatura
+    z = np.exp(z - np.max(z, axis=1, keepdims=True))
+    return z / np.sum(z, axis=1, keepdims=True)
+
+
+def log_verosimilitud_negativa(logits, y, temperatura=1.0):
+    z = logits / temperatura
+    return float(np.mean(_logsumexp(z) - z[np.arange(len(y)), y]))
+
+
+def error_calibracion(probs, y, cubetas=CUBETAS_ECE):
+    # ECE: diferencia media entre confianza y acierto, ponderada por el tamaño de cada cubeta
+    confianza = np.max(probs, axis=1)
+    acierto = np.argmax(probs, axis=1) == y
+    indices = np.minimum((confianza * cubetas).astype(int), cubetas - 1)
+    total = 0.0
+    for cubeta in range(cubetas):
+        mascara = indices == cubeta
+        if mascara.any():
+            total += mascara.mean() * abs(confianza[mascara].mean() - acierto[mascara].mean())
+    return float(total)
+
+
+def puntuacion_energia(logits):
+    # Energía negativa (logsumexp de los logits): baja cuando la imagen no se parece a nada del entrenamiento
+    return _logsumexp(logits)
+
+
+# --- Ajuste: temperatura por máxima verosimilitud y umbral de energía ---
+def ajustar_temperatura(logits, y):
+    # La NLL es unimodal en log(T): búsqueda de sección áurea, sin dependencias extra
+    razon = (np.sqrt(5) - 1) / 2
+    a, b = np.log(LIMITES_TEMPERATURA)
+    c, d = b - razon * (b - a), a + razon * (b - a)
+    fc, fd = log_verosimilitud_negativa(logits, y, np.exp(c)), log_verosimilitud_negativa(logits, y, np.exp(d))
+    for _ in range(ITERACIONES_BUSQUEDA):
+        if fc < fd:
+            b, d, fd = d, c, fc
+            c = b - razon * (b - a)
+            fc = log_verosimilitud_negativa(logits, y, np.exp(c))
+        else:
+            a, c, fc = c, d, fd
+            d = a + razon * (b - a)
+            fd = log_verosimilitud_negativa(logits, y, np.exp(d))
+    return float(np.exp((a + b) / 2))
+
+
+def calibrar(pesos, X, y, tasa_rechazo=TASA_RECHAZO_VAL, umbral_sin_calibrar=UMBRAL_CONFIANZA_SIN_CALIBRAR):
+    logits = logits_cabeza(pesos, X)
+    temperatura = ajustar_temperatura(logits, y)
+    energia = puntuacion_energia(logits)
+    umbral = float(np.quantile(energia, tasa_rechazo))
+    # La temperatura cambia la escala de la confianza: el umbral de "confianza baja" se traslada a la
+    # calibrada de modo que avise en la misma fracción de validación que el umbral original sobre la cruda
+    confianza_cruda = np.max(softmax(logits), axis=1) * 100
+    confianza_calibrada = np.max(softmax(logits, temperatura), axis=1) * 100
+    fraccion_baja = float(np.mean(confianza_cruda < umbral_sin_calibrar))
+    return {
+        "temperatura": temperatura,
+        "umbral_energia": umbral,
+        "tasa_rechazo_val": float(np.mean(energia < umbral)),
+        "umbral_confianza": float(np.quantile(confianza_calibrada, fraccion_baja)),
+        "tasa_confianza_baja_val": fraccion_baja,
+        "nll_antes": log_verosimilitud_negativa(logits, y),
+        "nll_despues": log_verosimilitud_negativa(logits, y, temperatura),
+        "ece_antes": error_calibracion(softmax(logits), y),
+        "ece_despues": error_calibracion(softmax(logits, temperatura), y),
+        "muestras": int(len(y)),
+        "creado": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+# --- Aplicación en el camino de inferencia ---
+def aplicar(estado, embeddings):
+    # Devuelve (probabilidades calibradas, reconocido por fila); sin calibración, softmax sin cambios y todo aceptado
+    logits = logits_cabeza(estado.cabeza, embeddings)
+    calibracion = estado.calibracion
+    if calibracion is None:
+        return softmax(logits), np.ones(len(logits), dtype=bool)
+    reconocido = puntuacion_energia(logits) >= calibracion["umbral_energia"]
+    return softmax(logits, calibracion["temperatura"]), reconocido
+
+
+def umbral_confianza(estado):
+    # En % y en la misma escala que la confianza que devuelve aplicar() para este estado
+    if estado.calibracion is None:
+        return UMBRAL_CONFIANZA_SIN_CALIBRAR
+    return estado.calibracion.get("umbral_confianza", UMBRAL_CONFIANZA_SIN_CALIBRAR)
+
+
+# --- Calibración en segundo plano de cada versión que llega sin ella ---
+def _requiere_calibrar(estado):
+    # Las calibraciones guardadas antes de existir el umbral de confianza se rehacen (los embeddings
+    # de validación ya están en caché, solo se repite el ajuste)
+    return estado.calibracion is None or "umbral_confianza" not in estado.calibracion
+
+
+class Calibrador:
+    def __init__(self, contenedor, preprocesar, directorio_cache=os.path.join(DIRECTORIO_FEEDBACK, "cache")):
+        self.contenedor = contenedor
+        self.preprocesar = preprocesar
+        self.directorio_cache = directorio_cache
+        self.estado = {"estado": "inactivo", "mensaje": "", "resultado": None}
+        self._hilo = None
+        self._lock = threading.Lock()
+
+    def en_curso(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def asegurar(self, estado=None):
+        # Se suscribe al contenedor: cada versión nueva sin calibrar se ajusta sola
+        estado = estado or self.contenedor.actual()
+        if not _requiere_calibrar(estado):
+            return False
+        with self._lock:
+            if self.en_curso():
+                return False
+            self._hilo = threading.Thread(target=self._ejecutar, args=(estado,), name="calibracion", daemon=True)
+            self.estado = {"estado": "en curso", "mensaje": f"Calibrando {estado.version}...", "resultado": None}
+            self._hilo.start()
+            return True
+
+    def _ejecutar(self, estado):
+        while True:
+            try:
+                self.estado = self._calibrar(estado)
+            except Exception as e:
+                self.estado = {"estado": "error", "mensaje": f"Error al calibrar: {e}", "resultado": None}
+                return
+            # Si mientras tanto se activó otra versión sin calibrar, se sigue con ella
+            siguiente = self.contenedor.actual()
+            if siguiente.version == estado.version or not _requiere_calibrar(siguiente):
+                return
+            estado = siguiente
+
+    def _calibrar(self, estado):
+        preprocesar = lambda img: self.preprocesar(img, estado.input_size)
+        # Los embeddings de validación se calculan una vez por base: las versiones de feedback solo cambian la cabeza
+        ruta_cache = os.path.join(self.directorio_cache, f"val_{estado.version_base}.npz")
+        X_val, y_val = embeddings_split(estado.extractor, preprocesar, DIRECTORIO_VAL, estado.carpetas_dataset,
+                                        ruta_cache)
+        if len(X_val) == 0:
+            return {"estado": "sin datos",
+                    "mensaje": f"No se encontró el split de validación en '{DIRECTORIO_VAL}'; se usa la confianza sin calibrar.",
+                    "resultado": None}
+
+        inicio = time.perf_counter()
+        calibracion = calibrar(estado.cabeza, X_val, y_val)
+        calibracion["segundos_ajuste"] = time.perf_counter() - inicio
+        self.contenedor.aplicar_calibracion(estado.version, calibracion)
+        return {"estado": "completado",
+                "mensaje": f"{estado.version} calibrado: T = {calibracion['temperatura']:.2f}, "
+                           f"ECE {calibracion['ece_antes']:.1%} → {calibracion['ece_despues']:.1%}.",
+                "resultado": calibracion}
@@ -0,0 +1,84 @@
+import hashlib
+import warnings
+from io import BytesIO
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# --- Límites de carga ---
+LIMITE_BYTES = 20 * 1024 * 1024
+LIMITE_PIXELES = 40_000_000
+FORMATOS_PERMITIDOS = {"JPEG", "PNG", "WEBP", "MPO"}
+# Lado mayor con el que se trabaja tras decodificar (anotación, Grad-CAM, exportación)
+LADO_TRABAJO = 1024
+# Lado mayor de la vista previa que se envía al navegador
+LADO_PREVIEW = 800
+
+# Pillow lanza DecompressionBombError a partir de 2× este valor; los límites propios van antes
+Image.MAX_IMAGE_PIXELS = LIMITE_PIXELES
+
+
+class ImagenRechazada(ValueError):
+    pass
+
+
+# --- Hash de contenido (clave de las cachés de decodificación y Grad-CAM, y del feedback) ---
+def hash_contenido(datos):
+    return hashlib.sha256(datos).hexdigest()
+
+
+# --- Inspección de cabecera (sin decodificar los píxeles) ---
+def inspeccionar(datos, limite_bytes=LIMITE_BYTES, limite_pixeles=LIMITE_PIXELES):
+    if len(datos) > limite_bytes:
+        raise ImagenRechazada(
+            f"El archivo pesa {len(datos) / 1024 / 1024:.1f} MB; el máximo es {limite_bytes / 1024 / 1024:.0f} MB."
+        )
+    try:
+        # Image.open solo lee la cabecera; los píxeles se decodifican en load()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            img = Image.open(BytesIO(datos))
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        raise ImagenRechazada(f"No se pudo leer la imagen: {e}") from e
+
+    if img.format not in FORMATOS_PERMITIDOS:
+        raise ImagenRechazada(f"Formato no soportado: {img.format}")
+    ancho, alto = img.size
+    if ancho <= 0 or alto <= 0 or ancho * alto > limite_pixeles:
+        raise ImagenRechazada(
+            f"La imagen mide {ancho}×{alto} ({ancho * alto / 1e6:.0f} MP); el máximo es {limite_pixeles / 1e6:.0f} MP."
+        )
+    return img
+
+
+# --- Decodificación a escala reducida ---
+def decodificar(img, lado=LADO_TRABAJO):
+    if img.format in ("JPEG", "MPO"):
+        # El decodificador JPEG escala por 1/2, 1/4 o 1/8 durante la lectura (DCT reducida)
+        img.draft("RGB", (lado, lado))
+    try:
+        img.load()
+    except (OSError, SyntaxError, ValueError) as e:
+        raise ImagenRechazada(f"La imagen está dañada o incompleta: {e}") from e
+
+    # Respetar la orientación de la cámara antes de descartar los metadatos
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if max(img.size) > lado:
+        img.thumbnail((lado, lado), Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+    # Copia sin EXIF ni otros metadatos (GPS, modelo de cámara...)
+    limpia = Image.frombytes("RGB", img.size, img.tobytes())
+    return limpia
+
+
+def vista_previa(img, lado=LADO_PREVIEW):
+    preview = img.copy()
+    preview.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+    return preview
+
+
+# --- Pipeline completo de carga ---
+def cargar_imagen(datos, lado=LADO_TRABAJO, lado_preview=LADO_PREVIEW):
+    img = decodificar(inspeccionar(datos), lado)
+    return img, vista_previa(img, lado_preview)
@@ -0,0 +1,110 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from metricas import medir, registrar_cache
+
+# --- Configuración ---
+MAXIMO_CACHE = 256
+OPACIDAD_MAPA = 0.4
+
+
+# --- Grad-CAM en la misma pasada que la predicción ---
+class ExplicadorGradCAM:
+    def __init__(self, estado):
+        modelo = estado.modelo
+        ultima_conv = next(
+            (capa for capa in reversed(modelo.layers) if isinstance(capa, tf.keras.layers.Conv2D)), None,
+        )
+        if ultima_conv is None:
+            raise ValueError("El modelo no tiene capas Conv2D: no se puede calcular Grad-CAM")
+
+        self.version = estado.version
+        self.capa = ultima_conv.name
+        # Se encadenan las capas sobre una entrada nueva: en un Sequential cargado de .keras, la salida
+        # de la conv y la del modelo quedan en nodos distintos del grafo y el gradiente sale None
+        entrada = tf.keras.Input(shape=modelo.input_shape[1:])
+        x = entrada
+        for capa in modelo.layers:
+            x = capa(x)
+            if capa is ultima_conv:
+                conv = x
+            if capa is modelo.layers[-2]:
+                embedding = x
+        self._modelo_cam = tf.keras.Model(entrada, [conv, embedding, x])
+        self._cabeza = modelo.layers[-1]
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @tf.function(reduce_retracing=True)
+    def _paso(self, x):
+        # Una pasada hacia adelante y un gradiente: el mapa sale junto con la predicción
+        with tf.GradientTape() as tape:
+            conv, embedding, pred = self._modelo_cam(x, training=False)
+            # Se usa el logit (antes del softmax) de la clase predicha, como en el artículo original
+            logits = tf.matmul(embedding, self._cabeza.kernel) + self._cabeza.bias
+            puntuacion = tf.gather(logits, tf.argmax(pred, axis=1), batch_dims=1)
+        # Cada muestra solo depende de su propia entrada, así que el gradiente de la suma es por muestra
+        gradientes = tape.gradient(puntuacion, conv)
+        pesos = tf.reduce_mean(gradientes, axis=(1, 2))
+        mapa = tf.nn.relu(tf.einsum("bhwc,bc->bhw", conv, pesos))
+        mapa = mapa / (tf.reduce_max(mapa, axis=(1, 2), keepdims=True) + 1e-8)
+        return embedding, pred, mapa
+
+    def explicar(self, lote, hashes=None):
+        # Devuelve (embeddings, probabilidades, mapas); las imágenes ya vistas salen de la caché
+        hashes = hashes or [None] * len(lote)
+        resultados = [None] * len(lote)
+        pendientes = []
+        with self._lock:
+            for i, hash_imagen in enumerate(hashes):
+                if hash_imagen is not None and hash_imagen in self._cache:
+                    self._cache.move_to_end(hash_imagen)
+                    resultados[i] = self._cache[hash_imagen]
+                    registrar_cache("gradcam", True)
+                else:
+                    pendientes.append(i)
+                    registrar_cache("gradcam", False)
+
+        if pendientes:
+            # Solo se mide la pasada real: los aciertos de caché (~0 ms) falsearían la media
+            with medir("inferencia_gradcam", imagenes=len(pendientes)):
+                embedding, pred, mapa = self._paso(tf.convert_to_tensor(lote[pendientes], dtype=tf.float32))
+                embedding, pred, mapa = embedding.numpy(), pred.numpy(), mapa.numpy()
+            with self._lock:
+                for j, i in enumerate(pendientes):
+                    resultados[i] = (embedding[j], pred[j], mapa[j])
+                    if hashes[i] is not None:
+                        self._cache[hashes[i]] = resultados[i]
+                        if len(self._cache) > MAXIMO_CACHE:
+                            self._cache.popitem(last=False)
+
+        embeddings, preds, mapas = zip(*resultados)
+        return np.stack(embeddings), np.stack(preds), np.stack(mapas)
+
+
+# --- Un explicador por versión del modelo (se reutiliza entre peticiones e hilos) ---
+_explicadores = OrderedDict()
+_lock_explicadores = threading.Lock()
+
+
+def obtener_explicador(estado):
+    with _lock_explicadores:
+        explicador = _explicadores.get(estado.version)
+        if explicador is None:
+            explicador = _explicadores[estado.version] = ExplicadorGradCAM(estado)
+            # Solo se conservan la versión activa y la anterior
+            while len(_explicadores) > 2:
+                _explicadores.popitem(last=False)
+        return explicador
+
+
+# --- Superposición del mapa de calor (BGR, para el flujo de anotación con OpenCV) ---
+def superponer_mapa(img_bgr, mapa, opacidad=OPACIDAD_MAPA):
+    alto, ancho = img_bgr.shape[:2]
+    mapa = cv2.resize(mapa.astype(np.float32), (ancho, alto), interpolation=cv2.INTER_LINEAR)
+    color = cv2.applyColorMap(np.uint8(255 * np.clip(mapa, 0, 1)), cv2.COLORMAP_JET)
+    return cv2.addWeighted(color, opacidad, img_bgr, 1 - opacidad, 0)
@@ -0,0 +1,347 @@
+import atexit
+import contextlib
+import datetime
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from impacto import COLUMNAS_BENEFICIO, factor_por_tonelada
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: sin flock, el cerrojo entre procesos es un archivo creado en exclusiva
+    fcntl = None
+
+# --- Configuración ---
+DIRECTORIO_MUNICIPAL = "municipal"
+# Eventos en memoria antes de escribir un archivo (o cada SEGUNDOS_VACIADO, lo que llegue antes)
+EVENTOS_POR_ARCHIVO = 50_000
+SEGUNDOS_VACIADO = 30
+SEGUNDOS_MANTENIMIENTO = 600
+# Sin fcntl, un cerrojo más antiguo que esto se considera abandonado por un proceso caído
+SEGUNDOS_CERROJO_ABANDONADO = 3600
+# Tamaño de la celda geográfica de los agregados (0.01° ≈ 1 km)
+DECIMALES_CELDA = 2
+MS_POR_DIA = 86_400_000
+# Metadato del archivo compacto con los nombres de los archivos que reúne
+CLAVE_PARTES_ORIGEN = b"partes_origen"
+
+ESQUEMA_EVENTOS = pa.schema([
+    ("fecha_hora", pa.timestamp("ms", tz="UTC")),
+    ("clase", pa.string()),
+    ("tipo_residuo", pa.string()),
+    ("confianza", pa.float32()),
+    ("latitud", pa.float64()),
+    ("longitud", pa.float64()),
+    ("origen", pa.string()),
+])
+
+# --- Equivalencias en toneladas ---
+# Peso medio supuesto de un residuo clasificado (kg); es una estimación para pasar de conteos a toneladas
+PESO_MEDIO_KG = {
+    "cartón": 0.30,
+    "vidrio": 0.35,
+    "metal": 0.05,
+    "papel": 0.05,
+    "plástico": 0.03,
+    "basura": 0.10,
+}
+# Los beneficios por tonelada salen de impacto.BENEFICIOS_POR_TONELADA, la tabla de la calculadora de app.py
+
+
+def _dia(numero):
+    return (datetime.date(1970, 1, 1) + datetime.timedelta(days=int(numero))).isoformat()
+
+
+def _escribir_atomico(tabla, ruta):
+    # Los lectores solo ven archivos .parquet completos
+    temporal = f"{ruta}.{uuid.uuid4().hex[:6]}.tmp"
+    pq.write_table(tabla, temporal, compression="zstd")
+    os.replace(temporal, ruta)
+
+
+def _archivos_del_dia(directorio):
+    # Una caída entre escribir el compacto y borrar sus partes deja las dos copias de los eventos: las
+    # partes que ya figuran en algún compacto se retiran antes de leer el día
+    archivos = set(glob.glob(os.path.join(directorio, "*.parquet")))
+    for ruta in [ruta for ruta in archivos if os.path.basename(ruta).startswith("compacto-")]:
+        try:
+            metadatos = pq.read_schema(ruta).metadata or {}
+        except FileNotFoundError:
+            # Otra réplica lo reunió en un compacto nuevo y lo borró
+            archivos.discard(ruta)
+            continue
+        for nombre in json.loads(metadatos.get(CLAVE_PARTES_ORIGEN, b"[]")):
+            cubierta = os.path.join(directorio, nombre)
+            if cubierta in archivos:
+                archivos.discard(cubierta)
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(cubierta)
+    return sorted(archivos)
+
+
+# --- Cerrojo entre procesos sin bloquear: indica si se obtuvo ---
+@contextlib.contextmanager
+def _cerrojo_exclusivo(ruta):
+    if fcntl is not None:
+        # flock se libera solo si el proceso muere
+        with open(ruta, "w") as cerrojo:
+            try:
+                fcntl.flock(cerrojo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            yield True
+        return
+
+    ruta = ruta + ".excl"
+    try:
+        descriptor = os.open(ruta, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            abandonado = time.time() - os.path.getmtime(ruta) > SEGUNDOS_CERROJO_ABANDONADO
+        except FileNotFoundError:
+            abandonado = True
+        if not abandonado:
+            yield False
+            return
+        # Lo dejó un proceso caído: se retira y se intenta una vez más
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(ruta)
+        try:
+            descriptor = os.open(ruta, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            yield False
+            return
+    os.close(descriptor)
+    try:
+        yield True
+    finally:
+        os.unlink(ruta)
+
+
+# --- Almacén de eventos particionado por día con agregados precalculados ---
+# municipal/eventos/fecha=AAAA-MM-DD/*.parquet  eventos en bruto (partes nuevas + un archivo compacto)
+# municipal/agregados/fecha=AAAA-MM-DD.parquet  agregados del día por material y celda
+# municipal/agregados/mes=AAAA-MM.parquet        los agregados diarios del mes juntos (lo que leen las consultas)
+class AlmacenEventos:
+    def __init__(self, directorio=DIRECTORIO_MUNICIPAL, eventos_por_archivo=EVENTOS_POR_ARCHIVO):
+        self.directorio = directorio
+        self.dir_eventos = os.path.join(directorio, "eventos")
+        self.dir_agregados = os.path.join(directorio, "agregados")
+        self.eventos_por_archivo = eventos_por_archivo
+        os.makedirs(self.dir_eventos, exist_ok=True)
+        os.makedirs(self.dir_agregados, exist_ok=True)
+
+        self._filas = {nombre: [] for nombre in ESQUEMA_EVENTOS.names}
+        self._tablas = []
+        self._pendientes_en_memoria = 0
+        self._lock = threading.Lock()
+        self._lock_escritura = threading.Lock()
+        # Días con eventos nuevos desde su último agregado (incluye lo que quedó de una ejecución anterior)
+        self._dias_sucios = set(self._detectar_dias_sucios())
+        self._hilo = None
+        self.ultimo_error = None
+
+    # --- Registro ---
+    def registrar(self, clase, tipo_residuo, confianza, latitud=None, longitud=None, origen="individual",
+                  instante=None):
+        instante = time.time() if instante is None else instante
+        with self._lock:
+            for nombre, valor in (("fecha_hora", int(instante * 1000)), ("clase", clase),
+                                  ("tipo_residuo", tipo_residuo), ("confianza", float(confianza)),
+                                  ("latitud", latitud), ("longitud", longitud), ("origen", origen)):
+                self._filas[nombre].append(valor)
+            self._pendientes_en_memoria += 1
+            lleno = self._pendientes_en_memoria >= self.eventos_por_archivo
+        if lleno:
+            self.vaciar()
+
+    def registrar_lote(self, columnas):
+        # columnas: {nombre: lista o array}; fecha_hora en milisegundos desde epoch (UTC)
+        tabla = pa.table({nombre: pa.array(columnas.get(nombre, [None] * len(columnas["clase"])), tipo)
+                          for nombre, tipo in zip(ESQUEMA_EVENTOS.names, ESQUEMA_EVENTOS.types)})
+        with self._lock:
+            self._tablas.append(tabla)
+            self._pendientes_en_memoria += tabla.num_rows
+            lleno = self._pendientes_en_memoria >= self.eventos_por_archivo
+        if lleno:
+            self.vaciar()
+
+    def vaciar(self):
+        with self._lock:
+            tablas, self._tablas = self._tablas, []
+            if self._filas["clase"]:
+                tablas.append(pa.table(self._filas, schema=ESQUEMA_EVENTOS))
+                self._filas = {nombre: [] for nombre in ESQUEMA_EVENTOS.names}
+            self._pendientes_en_memoria = 0
+        if not tablas:
+            return 0
+
+        tabla = pa.concat_tables(tablas)
+        dias = tabla["fecha_hora"].cast(pa.int64()).to_numpy() // MS_POR_DIA
+        with self._lock_escritura:
+            for numero in np.unique(dias):
+                fecha = _dia(numero)
+                directorio = os.path.join(self.dir_eventos, f"fecha={fecha}")
+                os.makedirs(directorio, exist_ok=True)
+                parte = tabla.filter(pa.array(dias == numero))
+                _escribir_atomico(parte, os.path.join(directorio, f"parte-{time.time_ns()}-{uuid.uuid4().hex[:6]}.parquet"))
+                with self._lock:
+                    self._dias_sucios.add(fecha)
+        return tabla.num_rows
+
+    # --- Compactación y agregados incrementales (solo los días que cambiaron) ---
+    def _detectar_dias_sucios(self):
+        for directorio in glob.glob(os.path.join(self.dir_eventos, "fecha=*")):
+            fecha = os.path.basename(directorio).split("=", 1)[1]
+            archivos = _archivos_del_dia(directorio)
+            ruta_agregado = os.path.join(self.dir_agregados, f"fecha={fecha}.parquet")
+            if archivos and (len(archivos) > 1 or not os.path.exists(ruta_agregado)
+                             or max(map(os.path.getmtime, archivos)) > os.path.getmtime(ruta_agregado)):
+                yield fecha
+
+    def mantenimiento(self):
+        self.vaciar()
+        with self._lock:
+            dias, self._dias_sucios = sorted(self._dias_sucios), set()
+        # Entre procesos (réplicas de la app) solo compacta uno a la vez; el resto lo intenta más tarde
+        with _cerrojo_exclusivo(os.path.join(self.directorio, ".mantenimiento.lock")) as obtenido:
+            if not obtenido:
+                with self._lock:
+                    self._dias_sucios.update(dias)
+                return []
+            for i, fecha in enumerate(dias):
+                try:
+                    self.compactar_dia(fecha)
+                    self.agregar_dia(fecha)
+                except Exception:
+                    # Los días que faltan siguen sucios para el próximo intento
+                    with self._lock:
+                        self._dias_sucios.update(dias[i:])
+                    raise
+            for mes in sorted({fecha[:7] for fecha in dias}):
+                self.agregar_mes(mes)
+        return dias
+
+    def compactar_dia(self, fecha):
+        directorio = os.path.join(self.dir_eventos, f"fecha={fecha}")
+        archivos = _archivos_del_dia(directorio)
+        if len(archivos) <= 1:
+            return
+        tabla = pa.concat_tables([pq.read_table(ruta, schema=ESQUEMA_EVENTOS) for ruta in archivos])
+        # Ordenado por hora, las consultas por rango dentro del día pueden saltarse grupos de filas
+        tabla = tabla.sort_by("fecha_hora")
+        # El compacto anota qué reúne: si el proceso cae antes de borrar las partes, no se cuentan dos veces
+        tabla = tabla.replace_schema_metadata({
+            CLAVE_PARTES_ORIGEN: json.dumps([os.path.basename(ruta) for ruta in archivos]),
+        })
+        _escribir_atomico(tabla, os.path.join(directorio, f"compacto-{time.time_ns()}.parquet"))
+        # Solo se borran las partes leídas: las que llegaron durante la compactación quedan para la próxima
+        for ruta in archivos:
+            os.remove(ruta)
+
+    def agregar_dia(self, fecha):
+        archivos = _archivos_del_dia(os.path.join(self.dir_eventos, f"fecha={fecha}"))
+        if not archivos:
+            return
+        # Solo las columnas necesarias: es lo que ahorra el formato columnar
+        tabla = pa.concat_tables([
+            pq.read_table(ruta, columns=["clase", "tipo_residuo", "confianza", "latitud", "longitud"])
+            for ruta in archivos
+        ])
+        tabla = tabla.append_column("lat_celda", pc.round(tabla["latitud"], DECIMALES_CELDA))
+        tabla = tabla.append_column("lon_celda", pc.round(tabla["longitud"], DECIMALES_CELDA))
+        agregado = tabla.group_by(["clase", "tipo_residuo", "lat_celda", "lon_celda"]).aggregate([
+            ("confianza", "count"), ("confianza", "sum"),
+        ])
+
+        eventos = agregado["confianza_count"].to_numpy()
+        clases = agregado["clase"].to_pylist()
+        toneladas = eventos * np.array([PESO_MEDIO_KG.get(clase, 0.0) for clase in clases]) / 1000
+        columnas = {
+            "fecha": pa.array([datetime.date.fromisoformat(fecha)] * agregado.num_rows, pa.date32()),
+            "clase": agregado["clase"],
+            "tipo_residuo": agregado["tipo_residuo"],
+            "lat_celda": agregado["lat_celda"],
+            "lon_celda": agregado["lon_celda"],
+            "eventos": agregado["confianza_count"],
+            "confianza_suma": agregado["confianza_sum"].cast(pa.float64()),
+            "toneladas": toneladas,
+        }
+        for nombre in COLUMNAS_BENEFICIO:
+            factores = np.array([factor_por_tonelada(clase, nombre) for clase in clases])
+            columnas[nombre] = toneladas * factores
+        _escribir_atomico(pa.table(columnas), os.path.join(self.dir_agregados, f"fecha={fecha}.parquet"))
+
+    def agregar_mes(self, mes):
+        # Abrir un archivo cuesta ~1 ms: un semestre son 6 archivos mensuales en vez de 182 diarios
+        archivos = sorted(glob.glob(os.path.join(self.dir_agregados, f"fecha={mes}-*.parquet")))
+        if archivos:
+            tabla = pa.concat_tables([pq.read_table(ruta) for ruta in archivos])
+            _escribir_atomico(tabla, os.path.join(self.dir_agregados, f"mes={mes}.parquet"))
+
+    # --- Consulta (solo lee agregados, nunca los eventos en bruto) ---
+    def consultar(self, desde, hasta, por=("clase", "tipo_residuo")):
+        # desde/hasta: fechas ISO (incluidas). por=None devuelve los agregados diarios sin agrupar
+        archivos = [
+            ruta for ruta in sorted(glob.glob(os.path.join(self.dir_agregados, "mes=*.parquet")))
+            if desde[:7] <= os.path.basename(ruta)[4:11] <= hasta[:7]
+        ]
+        if not archivos:
+            return None
+        tabla = pa.concat_tables([pq.read_table(ruta) for ruta in archivos])
+        fechas = tabla["fecha"]
+        tabla = tabla.filter(pc.and_(
+            pc.greater_equal(fechas, pa.scalar(datetime.date.fromisoformat(desde))),
+            pc.less_equal(fechas, pa.scalar(datetime.date.fromisoformat(hasta))),
+        ))
+        if por is None:
+            return tabla
+        sumas = ["eventos", "confianza_suma", "toneladas"] + COLUMNAS_BENEFICIO
+        agregado = tabla.group_by(list(por)).aggregate([(nombre, "sum") for nombre in sumas])
+        agregado = agregado.rename_columns([nombre.removesuffix("_sum") for nombre in agregado.column_names])
+        confianza_media = pc.divide(agregado["confianza_suma"], agregado["eventos"].cast(pa.float64()))
+        return agregado.append_column("confianza_media", confianza_media).drop_columns(["confianza_suma"])
+
+    def a_parquet(self, tabla):
+        buffer = pa.BufferOutputStream()
+        pq.write_table(tabla, buffer, compression="zstd")
+        return buffer.getvalue().to_pybytes()
+
+    def rango_fechas(self):
+        fechas = sorted(os.path.basename(ruta)[6:16]
+                        for ruta in glob.glob(os.path.join(self.dir_agregados, "fecha=*.parquet")))
+        return (fechas[0], fechas[-1]) if fechas else None
+
+    # --- Hilo en segundo plano ---
+    def iniciar(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, name="almacen-eventos", daemon=True)
+            self._hilo.start()
+            # Lo que queda en memoria al cerrar la app se escribe antes de salir
+            atexit.register(self.vaciar)
+        return self
+
+    def _bucle(self):
+        ultimo_mantenimiento = 0.0
+        while True:
+            time.sleep(SEGUNDOS_VACIADO)
+            try:
+                self.vaciar()
+                if time.monotonic() - ultimo_mantenimiento >= SEGUNDOS_MANTENIMIENTO:
+                    self.mantenimiento()
+                    ultimo_mantenimiento = time.monotonic()
+                self.ultimo_error = None
+            except Exception as e:
+                # Un fallo de disco no debe tumbar la app: se reintenta en la siguiente vuelta
+                self.ultimo_error = f"Error en el almacén de eventos: {e}"
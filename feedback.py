@@ -0,0 +1,305 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+
+from metricas import registrar_cache
+
+# --- Configuración ---
+DIRECTORIO_FEEDBACK = "feedback"
+DIRECTORIO_TEST = os.path.join("Classification", "test")
+DIRECTORIO_TRAIN = os.path.join("Classification", "train")
+EXTENSIONES_IMAGEN = (".jpg", ".jpeg", ".png", ".webp")
+MINIMO_CORRECCIONES = 20
+TOLERANCIA_TEST = 0.01
+EPOCAS_CABEZA = 30
+EPOCAS_COMPLETAS = 30
+BATCH_SIZE = 32
+
+
+# --- Almacén de correcciones (solo se agregan líneas, nunca se reescriben) ---
+class AlmacenFeedback:
+    def __init__(self, directorio=DIRECTORIO_FEEDBACK):
+        self.directorio = directorio
+        self.ruta_correcciones = os.path.join(directorio, "correcciones.jsonl")
+        self.dir_embeddings = os.path.join(directorio, "embeddings")
+        self.ruta_estado = os.path.join(directorio, "estado_reentrenamiento.json")
+        self._lock = threading.Lock()
+        os.makedirs(self.dir_embeddings, exist_ok=True)
+
+    def _ruta_embedding(self, version_base, hash_imagen):
+        return os.path.join(self.dir_embeddings, str(version_base), f"{hash_imagen}.npy")
+
+    def registrar(self, hash_imagen, clase_predicha, clase_corregida, confianza, embedding, version_base):
+        # El embedding se guarda una sola vez por imagen para no repetir la parte convolucional
+        ruta_embedding = self._ruta_embedding(version_base, hash_imagen)
+        if not os.path.exists(ruta_embedding):
+            os.makedirs(os.path.dirname(ruta_embedding), exist_ok=True)
+            np.save(ruta_embedding, np.asarray(embedding, dtype=np.float32))
+
+        registro = {
+            "hash": hash_imagen,
+            "clase_predicha": clase_predicha,
+            "clase_corregida": clase_corregida,
+            "confianza": float(confianza),
+            "fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        with self._lock:
+            with open(self.ruta_correcciones, "a", encoding="utf-8") as f:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        return registro
+
+    def leer(self):
+        if not os.path.exists(self.ruta_correcciones):
+            return []
+        registros = []
+        with open(self.ruta_correcciones, encoding="utf-8") as f:
+            for linea in f:
+                linea = linea.strip()
+                if not linea:
+                    continue
+                try:
+                    registros.append(json.loads(linea))
+                except json.JSONDecodeError:
+                    # Una línea truncada por un corte no debe invalidar el resto
+                    continue
+        return registros
+
+    # --- Correcciones ya consumidas por un reentrenamiento (sobrevive a los reinicios) ---
+    def correcciones_usadas(self):
+        try:
+            with open(self.ruta_estado, encoding="utf-8") as f:
+                return int(json.load(f)["correcciones_usadas"])
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, ValueError):
+            return 0
+
+    def marcar_usadas(self, total):
+        temporal = self.ruta_estado + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({"correcciones_usadas": int(total), "fecha": time.strftime("%Y-%m-%d %H:%M:%S")}, f)
+        os.replace(temporal, self.ruta_estado)
+
+    def cargar_dataset(self, clases, version_base):
+        # La última corrección de cada imagen es la que vale
+        ultima_por_hash = {}
+        for registro in self.leer():
+            ultima_por_hash[registro["hash"]] = registro["clase_corregida"]
+
+        X, y = [], []
+        for hash_imagen, clase in ultima_por_hash.items():
+            ruta_embedding = self._ruta_embedding(version_base, hash_imagen)
+            if clase not in clases or not os.path.exists(ruta_embedding):
+                continue
+            X.append(np.load(ruta_embedding))
+            y.append(clases.index(clase))
+
+        if not X:
+            return np.zeros((0, 0), dtype=np.float32), np.zeros((0,), dtype=np.int64)
+        return np.stack(X).astype(np.float32), np.asarray(y, dtype=np.int64)
+
+
+# --- Embeddings de un split en disco (se calculan una vez por versión de modelo) ---
+def listar_split(directorio, carpetas):
+    # carpetas: nombres de las carpetas del dataset en el orden de los índices de salida del modelo
+    # (las del notebook están en inglés: cardboard, glass, ...; no coinciden con los nombres de las clases)
+    rutas, etiquetas = [], []
+    if not os.path.isdir(directorio):
+        return rutas, etiquetas
+    for indice, carpeta in enumerate(carpetas):
+        dir_clase = os.path.join(directorio, carpeta)
+        if not os.path.isdir(dir_clase):
+            # Con una carpeta de menos las etiquetas quedarían desplazadas o la validación vacía sin avisar
+            raise FileNotFoundError(
+                f"Falta la carpeta '{carpeta}' en '{directorio}' (se esperaban {list(carpetas)}); "
+                f"revisa 'carpetas_dataset' en la metadata del modelo"
+            )
+        for nombre in sorted(os.listdir(dir_clase)):
+            if nombre.lower().endswith(EXTENSIONES_IMAGEN):
+                rutas.append(os.path.join(dir_clase, nombre))
+                etiquetas.append(indice)
+    return rutas, etiquetas
+
+
+def embeddings_split(extractor, preprocesar, directorio, carpetas, ruta_cache):
+    if os.path.exists(ruta_cache):
+        registrar_cache("embeddings_split", True)
+        datos = np.load(ruta_cache)
+        return datos["X"], datos["y"]
+    registrar_cache("embeddings_split", False)
+
+    rutas, etiquetas = listar_split(directorio, carpetas)
+    if not rutas:
+        return np.zeros((0, 0), dtype=np.float32), np.zeros((0,), dtype=np.int64)
+
+    bloques = []
+    for inicio in range(0, len(rutas), BATCH_SIZE):
+        lote = []
+        for ruta in rutas[inicio:inicio + BATCH_SIZE]:
+            with Image.open(ruta) as img:
+                lote.append(preprocesar(img)[0])
+        embedding, _ = extractor(np.stack(lote), training=False)
+        bloques.append(np.asarray(embedding, dtype=np.float32))
+
+    X = np.concatenate(bloques)
+    y = np.asarray(etiquetas, dtype=np.int64)
+    os.makedirs(os.path.dirname(ruta_cache), exist_ok=True)
+    np.savez(ruta_cache, X=X, y=y)
+    return X, y
+
+
+# --- Precisión de una cabeza densa sobre embeddings ya calculados ---
+def precision_cabeza(pesos, X, y):
+    if len(X) == 0:
+        return float("nan")
+    W, b = pesos
+    logits = X @ W + b
+    return float(np.mean(np.argmax(logits, axis=1) == y))
+
+
+# --- Reentrenamiento solo de la capa de clasificación ---
+def ajustar_cabeza(modelo, X, y, epocas=EPOCAS_CABEZA):
+    W, b = modelo.layers[-1].get_weights()
+    cabeza = tf.keras.Sequential([
+        tf.keras.Input(shape=(W.shape[0],)),
+        tf.keras.layers.Dense(W.shape[1], activation="softmax"),
+    ])
+    cabeza.layers[-1].set_weights([W, b])
+    cabeza.compile(optimizer=tf.keras.optimizers.Adam(1e-3),
+                   loss="sparse_categorical_crossentropy")
+    cabeza.fit(X, y, epochs=epocas, batch_size=BATCH_SIZE, verbose=0)
+    return cabeza.layers[-1].get_weights()
+
+
+def modelo_con_cabeza(modelo, pesos_cabeza):
+    nuevo = tf.keras.models.clone_model(modelo)
+    nuevo.set_weights(modelo.get_weights())
+    nuevo.layers[-1].set_weights(pesos_cabeza)
+    return nuevo
+
+
+# --- Estimación del coste de reentrenar el modelo completo ---
+def estimar_reentrenamiento_completo(modelo, preprocesar, carpetas):
+    rutas, _ = listar_split(DIRECTORIO_TEST, carpetas)
+    rutas = rutas[:BATCH_SIZE]
+    if not rutas:
+        return None
+
+    lote = []
+    for ruta in rutas:
+        with Image.open(ruta) as img:
+            lote.append(preprocesar(img)[0])
+    x = tf.convert_to_tensor(np.stack(lote))
+    y = tf.zeros((len(lote),), dtype=tf.int64)
+    perdida = tf.keras.losses.SparseCategoricalCrossentropy()
+
+    # Un paso hacia adelante y hacia atrás por toda la red, sin aplicar gradientes
+    def paso():
+        with tf.GradientTape() as tape:
+            pred = modelo(x, training=True)
+            valor = perdida(y, pred)
+        return tape.gradient(valor, modelo.trainable_variables)
+
+    paso()
+    inicio = time.perf_counter()
+    paso()
+    segundos_paso = time.perf_counter() - inicio
+
+    n_train = len(listar_split(DIRECTORIO_TRAIN, carpetas)[0])
+    if n_train == 0:
+        # Split 60/20/20 del notebook: train es tres veces test
+        n_train = 3 * len(listar_split(DIRECTORIO_TEST, carpetas)[0])
+    pasos_por_epoca = max(1, -(-n_train // BATCH_SIZE))
+    return segundos_paso * pasos_por_epoca * EPOCAS_COMPLETAS
+
+
+# --- Trabajo de reentrenamiento en segundo plano ---
+class Reentrenador:
+    def __init__(self, almacen, contenedor, preprocesar):
+        self.almacen = almacen
+        self.contenedor = contenedor
+        self.preprocesar = preprocesar
+        self.estado = {"estado": "inactivo", "mensaje": "", "resultado": None}
+        self._hilo = None
+        self._lock = threading.Lock()
+
+    def en_curso(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def pendientes(self):
+        return len(self.almacen.leer()) - self.almacen.correcciones_usadas()
+
+    def lanzar(self):
+        with self._lock:
+            if self.en_curso():
+                return False
+            self._hilo = threading.Thread(target=self._ejecutar, name="reentrenamiento", daemon=True)
+            self.estado = {"estado": "en curso", "mensaje": "Reentrenando la capa de clasificación...", "resultado": None}
+            self._hilo.start()
+            return True
+
+    def lanzar_si_corresponde(self, minimo=MINIMO_CORRECCIONES):
+        if self.pendientes() >= minimo:
+            return self.lanzar()
+        return False
+
+    def _ejecutar(self):
+        try:
+            self.estado = self._reentrenar()
+        except Exception as e:
+            self.estado = {"estado": "error", "mensaje": f"Error al reentrenar: {e}", "resultado": None}
+
+    def _reentrenar(self):
+        estado = self.contenedor.actual()
+        modelo, clases, version_base = estado.modelo, estado.clases, estado.version_base
+        preprocesar = lambda img: self.preprocesar(img, estado.input_size)
+        X, y = self.almacen.cargar_dataset(clases, version_base)
+        total_correcciones = len(self.almacen.leer())
+        if len(X) == 0:
+            return {"estado": "inactivo", "mensaje": "No hay correcciones acumuladas.", "resultado": None}
+
+        ruta_cache = os.path.join(self.almacen.directorio, "cache", f"test_{version_base}.npz")
+        X_test, y_test = embeddings_split(estado.extractor, preprocesar, DIRECTORIO_TEST, estado.carpetas_dataset,
+                                          ruta_cache)
+        if len(X_test) == 0:
+            return {"estado": "rechazado",
+                    "mensaje": f"No se encontró el split de test en '{DIRECTORIO_TEST}'; no se puede validar.",
+                    "resultado": None}
+
+        inicio = time.perf_counter()
+        pesos = ajustar_cabeza(modelo, X, y)
+        segundos_ajuste = time.perf_counter() - inicio
+
+        precision_base = precision_cabeza(modelo.layers[-1].get_weights(), X_test, y_test)
+        precision_nueva = precision_cabeza(pesos, X_test, y_test)
+        resultado = {
+            "correcciones": int(len(X)),
+            "precision_test_base": precision_base,
+            "precision_test_nueva": precision_nueva,
+            "precision_correcciones": precision_cabeza(pesos, X, y),
+            "segundos_ajuste": segundos_ajuste,
+            "segundos_completo_estimado": estimar_reentrenamiento_completo(modelo, preprocesar,
+                                                                           estado.carpetas_dataset),
+        }
+        # Aceptado o rechazado, estas correcciones no vuelven a lanzar el reentrenamiento al reiniciar
+        self.almacen.marcar_usadas(total_correcciones)
+
+        if precision_nueva < precision_base - TOLERANCIA_TEST:
+            return {"estado": "rechazado",
+                    "mensaje": f"La precisión en test bajó de {precision_base:.1%} a {precision_nueva:.1%}; se mantiene el modelo actual.",
+                    "resultado": resultado}
+
+        # Solo cambia la cabeza: la nueva versión comparte base y los embeddings cacheados siguen valiendo
+        metricas = {"precision_test": precision_nueva, "correcciones": int(len(X))}
+        version = self.contenedor.publicar_y_activar(
+            modelo_con_cabeza(modelo, pesos), metricas, origen="feedback", misma_base=True,
+        )
+        resultado["version"] = version
+        return {"estado": "completado",
+                "mensaje": f"Modelo {version} activo: precisión en test {precision_base:.1%} → {precision_nueva:.1%}.",
+                "resultado": resultado}
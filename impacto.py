@@ -0,0 +1,31 @@
+# --- Beneficios por tonelada reciclada ---
+# Una sola tabla numérica para la calculadora de impacto de app.py y los agregados municipales.
+BENEFICIOS_POR_TONELADA = {
+    "cartón": {"arboles": 17, "energia_kwh": 4000, "agua_galones": 7000},
+    "vidrio": {"energia_pct": 30, "co2_pct": 20},
+    "metal": {"energia_pct": 74, "mineral_toneladas": 1.5},
+    "papel": {"energia_kwh": 4000, "agua_galones": 7000, "arboles": 17},
+    "plástico": {"energia_kwh": 5774, "petroleo_barriles": 16.3},
+}
+TEXTO_BENEFICIO = {
+    "arboles": "{} árboles",
+    "energia_kwh": "{} kWh",
+    "agua_galones": "{} galones",
+    "mineral_toneladas": "{} toneladas de mineral",
+    "petroleo_barriles": "{} barriles",
+    "energia_pct": "{}% de energía",
+    "co2_pct": "{}% menos CO2",
+}
+# Los ahorros en porcentaje (energía del vidrio y el metal, CO2 del vidrio) no se pueden sumar entre
+# toneladas: solo estas columnas pasan a los agregados
+COLUMNAS_BENEFICIO = ["arboles", "energia_kwh", "agua_galones", "mineral_toneladas", "petroleo_barriles"]
+
+
+def factor_por_tonelada(clase, columna):
+    return BENEFICIOS_POR_TONELADA.get(clase, {}).get(columna, 0.0)
+
+
+def describir_beneficios(clase):
+    # Textos de la calculadora, en el orden de la tabla: "4,000 kWh", "30% de energía"...
+    return [TEXTO_BENEFICIO[columna].format(f"{valor:,g}")
+            for columna, valor in BENEFICIOS_POR_TONELADA.get(clase, {}).items()]
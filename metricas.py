@@ -0,0 +1,350 @@
+import atexit
+import bisect
+import collections
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Configuración ---
+# METRICAS_PUERTO: si se define, se sirve /metrics en ese puerto
+# METRICAS_ARCHIVO_SPANS: si se define, se escriben los spans en formato OTLP JSON (un lote por línea,
+# lo que lee el receptor otlpjsonfile del OpenTelemetry Collector)
+PUERTO_METRICAS = os.environ.get("METRICAS_PUERTO")
+ARCHIVO_SPANS = os.environ.get("METRICAS_ARCHIVO_SPANS")
+NOMBRE_SERVICIO = os.environ.get("OTEL_SERVICE_NAME", "clasificador-residuos")
+SEGUNDOS_EXPORTACION = 1.0
+# Spans que pueden esperar en memoria si el disco se atasca; por encima se descartan los más antiguos
+MAXIMO_SPANS_EN_COLA = 100_000
+LIMITES_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _formatear_etiquetas(nombres, valores):
+    if not nombres:
+        return ""
+    pares = []
+    for nombre, valor in zip(nombres, valores):
+        valor = str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pares.append(f'{nombre}="{valor}"')
+    return "{" + ",".join(pares) + "}"
+
+
+# --- Tipos de métricas ---
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, cantidad=1, **etiquetas):
+        clave = tuple(etiquetas.get(n, "") for n in self.etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def valor(self, **etiquetas):
+        return self._valores.get(tuple(etiquetas.get(n, "") for n in self.etiquetas), 0)
+
+    def muestras(self):
+        with self._lock:
+            return [(self.nombre + _formatear_etiquetas(self.etiquetas, clave), valor)
+                    for clave, valor in sorted(self._valores.items())]
+
+
+class Indicador(Contador):
+    tipo = "gauge"
+
+    def fijar(self, valor, **etiquetas):
+        clave = tuple(etiquetas.get(n, "") for n in self.etiquetas)
+        with self._lock:
+            self._valores[clave] = valor
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES_LATENCIA):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.limites = tuple(limites)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, **etiquetas):
+        clave = tuple(etiquetas.get(n, "") for n in self.etiquetas)
+        indice = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                # cubetas (no acumuladas) + [suma, cuenta]
+                serie = self._series[clave] = [0] * (len(self.limites) + 1) + [0.0, 0]
+            serie[indice] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def resumen(self, **etiquetas):
+        serie = self._series.get(tuple(etiquetas.get(n, "") for n in self.etiquetas))
+        if not serie:
+            return {"cuenta": 0, "suma": 0.0, "media": 0.0}
+        return {"cuenta": serie[-1], "suma": serie[-2], "media": serie[-2] / serie[-1]}
+
+    def muestras(self):
+        filas = []
+        with self._lock:
+            series = {clave: list(serie) for clave, serie in self._series.items()}
+        for clave, serie in sorted(series.items()):
+            acumulado = 0
+            for limite, cantidad in zip(self.limites + (float("inf"),), serie):
+                acumulado += cantidad
+                le = "+Inf" if limite == float("inf") else repr(limite)
+                filas.append((self.nombre + "_bucket" + _formatear_etiquetas(self.etiquetas + ("le",), clave + (le,)), acumulado))
+            filas.append((self.nombre + "_sum" + _formatear_etiquetas(self.etiquetas, clave), serie[-2]))
+            filas.append((self.nombre + "_count" + _formatear_etiquetas(self.etiquetas, clave), serie[-1]))
+        return filas
+
+
+# --- Registro global de métricas ---
+class RegistroMetricas:
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _registrar(self, clase, nombre, *args, **kwargs):
+        with self._lock:
+            if nombre not in self._metricas:
+                self._metricas[nombre] = clase(nombre, *args, **kwargs)
+            return self._metricas[nombre]
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        return self._registrar(Contador, nombre, ayuda, etiquetas)
+
+    def indicador(self, nombre, ayuda, etiquetas=()):
+        return self._registrar(Indicador, nombre, ayuda, etiquetas)
+
+    def histograma(self, nombre, ayuda, etiquetas=(), limites=LIMITES_LATENCIA):
+        return self._registrar(Histograma, nombre, ayuda, etiquetas, limites)
+
+    def exposicion(self):
+        actualizar_memoria()
+        lineas = []
+        for nombre, metrica in sorted(self._metricas.items()):
+            lineas.append(f"# HELP {nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {nombre} {metrica.tipo}")
+            for serie, valor in metrica.muestras():
+                lineas.append(f"{serie} {valor}")
+        return "\n".join(lineas) + "\n"
+
+
+registro = RegistroMetricas()
+
+LATENCIA_ETAPA = registro.histograma(
+    "clasificador_etapa_segundos", "Duración de cada etapa del pipeline de clasificación", ("etapa",))
+LATENCIA_POR_IMAGEN = registro.histograma(
+    "clasificador_etapa_por_imagen_segundos",
+    "Duración de cada etapa dividida entre las imágenes del lote (compara lotes de distinto tamaño)", ("etapa",))
+CLASIFICACIONES = registro.contador(
+    "clasificador_clasificaciones_total", "Clasificaciones realizadas por clase predicha", ("clase",))
+BAJA_CONFIANZA = registro.contador(
+    "clasificador_baja_confianza_total", "Clasificaciones por debajo del umbral de confianza")
+CACHE_ACIERTOS = registro.contador(
+    "clasificador_cache_aciertos_total", "Aciertos de caché", ("cache",))
+CACHE_FALLOS = registro.contador(
+    "clasificador_cache_fallos_total", "Fallos de caché", ("cache",))
+MEMORIA = registro.indicador(
+    "proceso_memoria_bytes", "Memoria del proceso", ("tipo",))
+
+
+# --- Memoria del proceso ---
+def actualizar_memoria():
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for linea in f:
+                if linea.startswith(("VmRSS:", "VmHWM:")):
+                    clave, valor = linea.split(":", 1)
+                    MEMORIA.fijar(int(valor.split()[0]) * 1024, tipo=clave.lower())
+    except OSError:
+        # Fuera de Linux solo se informa el pico
+        import resource
+        MEMORIA.fijar(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, tipo="vmhwm")
+
+
+def registrar_cache(nombre, acierto):
+    (CACHE_ACIERTOS if acierto else CACHE_FALLOS).inc(cache=nombre)
+
+
+# --- Spans en formato OTLP JSON ---
+def _valor_otlp(valor):
+    # bool antes que int: True es un int en Python. Los enteros de 64 bits van como texto en OTLP JSON
+    if isinstance(valor, bool):
+        return {"boolValue": valor}
+    if isinstance(valor, int):
+        return {"intValue": str(valor)}
+    if isinstance(valor, float):
+        return {"doubleValue": valor}
+    return {"stringValue": str(valor)}
+
+
+def _atributos_otlp(atributos):
+    return [{"key": clave, "value": _valor_otlp(valor)} for clave, valor in atributos.items()]
+
+
+def _span_otlp(span):
+    return {
+        "traceId": span["traceId"],
+        "spanId": span["spanId"],
+        "parentSpanId": span["parentSpanId"],
+        "name": span["name"],
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(span["startTimeUnixNano"]),
+        "endTimeUnixNano": str(span["endTimeUnixNano"]),
+        "attributes": _atributos_otlp(span["attributes"]),
+    }
+
+
+class ExportadorSpans:
+    # El hilo de la petición solo encola el span (deque.append no toma ningún lock); un hilo aparte
+    # los convierte a OTLP y escribe un lote por línea
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._cola = collections.deque(maxlen=MAXIMO_SPANS_EN_COLA)
+        self._lock = threading.Lock()
+        self._hilo = None
+        self.ultimo_error = None
+
+    def agregar(self, span):
+        self._cola.append(span)
+
+    def vaciar(self):
+        with self._lock:
+            spans = []
+            while self._cola:
+                spans.append(self._cola.popleft())
+            if not spans:
+                return 0
+            lote = {"resourceSpans": [{
+                "resource": {"attributes": _atributos_otlp({"service.name": NOMBRE_SERVICIO})},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": [_span_otlp(span) for span in spans]}],
+            }]}
+            with open(self.ruta, "a", encoding="utf-8") as f:
+                f.write(json.dumps(lote, ensure_ascii=False) + "\n")
+            return len(spans)
+
+    def iniciar(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, name="exportador-spans", daemon=True)
+            self._hilo.start()
+            # Los spans que quedan en la cola al cerrar la app se escriben antes de salir
+            atexit.register(self.vaciar)
+        return self
+
+    def _bucle(self):
+        while True:
+            time.sleep(SEGUNDOS_EXPORTACION)
+            try:
+                self.vaciar()
+                self.ultimo_error = None
+            except Exception as e:
+                self.ultimo_error = f"Error al escribir spans: {e}"
+
+
+_span_actual = contextvars.ContextVar("span_actual", default=None)
+exportador_spans = ExportadorSpans(ARCHIVO_SPANS).iniciar() if ARCHIVO_SPANS else None
+
+
+def _observar(histograma, etapa, duracion, imagenes):
+    histograma.observar(duracion, etapa=etapa)
+    if imagenes:
+        LATENCIA_POR_IMAGEN.observar(duracion / imagenes, etapa=etapa)
+
+
+@contextlib.contextmanager
+def medir(etapa, histograma=None, exportar=True, imagenes=None, **atributos):
+    # exportar=False: solo el histograma, sin span; exportar=ExportadorSpans: el span va a ese exportador
+    # en lugar del global (la medida de sobrecarga lo usa para no ensuciar el archivo real)
+    # imagenes=n: además se anota la duración por imagen, para comparar llamadas de 1 imagen con lotes
+    histograma = histograma or LATENCIA_ETAPA
+    exportador = exportar if isinstance(exportar, ExportadorSpans) else exportador_spans if exportar else None
+    if exportador is None:
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            _observar(histograma, etapa, time.perf_counter() - inicio, imagenes)
+        return
+
+    padre = _span_actual.get()
+    span = {
+        "traceId": padre["traceId"] if padre else os.urandom(16).hex(),
+        "spanId": os.urandom(8).hex(),
+        "parentSpanId": padre["spanId"] if padre else "",
+        "name": etapa,
+        "startTimeUnixNano": time.time_ns(),
+        "attributes": dict(atributos, imagenes=imagenes) if imagenes else atributos,
+    }
+    token = _span_actual.set(span)
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        _observar(histograma, etapa, time.perf_counter() - inicio, imagenes)
+        span["endTimeUnixNano"] = time.time_ns()
+        _span_actual.reset(token)
+        exportador.agregar(span)
+
+
+# --- Sobrecarga de la instrumentación ---
+_sobrecarga = None
+
+
+def medir_sobrecarga(repeticiones=10000):
+    # Se mide una sola vez por proceso, sobre un histograma aparte y por el mismo camino que las etapas
+    # reales: con spans activados, cada medida encola su span en un exportador que escribe en os.devnull.
+    # Devuelve (segundos en el hilo de la petición, segundos por span en el hilo exportador o None)
+    global _sobrecarga
+    if _sobrecarga is None:
+        histograma = Histograma("sobrecarga", "", ("etapa",))
+        exportador = ExportadorSpans(os.devnull) if exportador_spans is not None else False
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            with medir("sobrecarga", histograma, exportar=exportador):
+                pass
+        en_peticion = (time.perf_counter() - inicio) / repeticiones
+        en_segundo_plano = None
+        if exportador:
+            inicio = time.perf_counter()
+            exportador.vaciar()
+            en_segundo_plano = (time.perf_counter() - inicio) / repeticiones
+        _sobrecarga = (en_peticion, en_segundo_plano)
+    return _sobrecarga
+
+
+# --- Endpoint /metrics ---
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        cuerpo = registro.exposicion().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def iniciar_servidor(puerto=PUERTO_METRICAS):
+    if not puerto:
+        return None
+    servidor = ThreadingHTTPServer(("0.0.0.0", int(puerto)), _ManejadorMetricas)
+    threading.Thread(target=servidor.serve_forever, name="servidor-metricas", daemon=True).start()
+    return servidor
@@ -0,0 +1,267 @@
+import copy
+import gc
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import tensorflow as tf
+
+# --- Configuración ---
+DIRECTORIO_REGISTRO = "modelos"
+ARCHIVO_MODELO = "modelo.keras"
+ARCHIVO_METADATA = "metadata.json"
+ARCHIVO_CALIBRACION = "calibracion.json"
+ARCHIVO_ACTUAL = "ACTUAL"
+INTERVALO_VIGILANCIA = 10
+
+
+# --- Registro de versiones en disco ---
+# modelos/
+#   v0001/modelo.keras, v0001/metadata.json, v0001/calibracion.json (se añade después de publicar)
+#   v0002/...
+#   ACTUAL  -> nombre de la versión activa
+class RegistroModelos:
+    def __init__(self, directorio=DIRECTORIO_REGISTRO):
+        self.directorio = directorio
+        self._lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+
+    def listar(self):
+        return sorted(
+            nombre for nombre in os.listdir(self.directorio)
+            if nombre.startswith("v") and os.path.exists(os.path.join(self.directorio, nombre, ARCHIVO_METADATA))
+        )
+
+    def metadata(self, version):
+        with open(os.path.join(self.directorio, version, ARCHIVO_METADATA), encoding="utf-8") as f:
+            metadata = json.load(f)
+        ruta_calibracion = os.path.join(self.directorio, version, ARCHIVO_CALIBRACION)
+        if os.path.exists(ruta_calibracion):
+            with open(ruta_calibracion, encoding="utf-8") as f:
+                metadata["calibracion"] = json.load(f)
+        return metadata
+
+    def guardar_calibracion(self, version, calibracion):
+        # El modelo y su metadata no cambian: la calibración va en un archivo aparte
+        ruta = os.path.join(self.directorio, version, ARCHIVO_CALIBRACION)
+        temporal = ruta + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(calibracion, f, ensure_ascii=False, indent=2)
+        os.replace(temporal, ruta)
+
+    def version_actual(self):
+        ruta = os.path.join(self.directorio, ARCHIVO_ACTUAL)
+        if os.path.exists(ruta):
+            with open(ruta, encoding="utf-8") as f:
+                version = f.read().strip()
+            if version in self.listar():
+                return version
+        versiones = self.listar()
+        return versiones[-1] if versiones else None
+
+    def marca_actual(self):
+        # Se usa para detectar despliegues hechos por otra réplica o a mano
+        ruta = os.path.join(self.directorio, ARCHIVO_ACTUAL)
+        return os.path.getmtime(ruta) if os.path.exists(ruta) else None
+
+    def activar(self, version):
+        if version not in self.listar():
+            raise ValueError(f"La versión '{version}' no existe en el registro")
+        ruta = os.path.join(self.directorio, ARCHIVO_ACTUAL)
+        temporal = ruta + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(temporal, ruta)
+
+    def publicar(self, modelo, clases, metricas=None, origen="manual", base=None, carpetas_dataset=None):
+        validar_clases(modelo, clases)
+        if carpetas_dataset is not None and len(carpetas_dataset) != len(clases):
+            raise ValueError(f"Las carpetas del dataset {list(carpetas_dataset)} no coinciden con las clases {list(clases)}")
+        with self._lock:
+            versiones = self.listar()
+            numero = int(versiones[-1][1:]) + 1 if versiones else 1
+            version = f"v{numero:04d}"
+            # Se escribe en un directorio temporal y se renombra: nunca queda una versión a medias
+            temporal = os.path.join(self.directorio, f".{version}.tmp")
+            shutil.rmtree(temporal, ignore_errors=True)
+            os.makedirs(temporal)
+            modelo.save(os.path.join(temporal, ARCHIVO_MODELO))
+            metadata = {
+                "version": version,
+                "clases": list(clases),
+                # Carpetas de Classification/{train,val,test} en el orden de las salidas del modelo
+                "carpetas_dataset": list(carpetas_dataset or clases),
+                "input_size": list(modelo.input_shape[1:3]),
+                "metricas": metricas or {},
+                "origen": origen,
+                "base": base or version,
+                "creado": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            with open(os.path.join(temporal, ARCHIVO_METADATA), "w", encoding="utf-8") as f:
+                json.dump(metadata, f, ensure_ascii=False, indent=2)
+            os.rename(temporal, os.path.join(self.directorio, version))
+        return version
+
+    def cargar(self, version):
+        metadata = self.metadata(version)
+        modelo = tf.keras.models.load_model(os.path.join(self.directorio, version, ARCHIVO_MODELO))
+        validar_clases(modelo, metadata["clases"])
+        return modelo, metadata
+
+
+def validar_clases(modelo, clases):
+    # Una lista de clases que no coincide con la salida del modelo etiquetaría mal sin avisar
+    salidas = modelo.output_shape[-1]
+    if len(clases) != salidas or len(set(clases)) != len(clases):
+        raise ValueError(f"La lista de clases {list(clases)} no coincide con las {salidas} salidas del modelo")
+
+
+# --- Estado inmutable de una versión cargada ---
+class EstadoModelo:
+    def __init__(self, modelo, metadata):
+        self.modelo = modelo
+        self.metadata = metadata
+        self.version = metadata["version"]
+        self.version_base = metadata.get("base", self.version)
+        self.clases = list(metadata["clases"])
+        # Versiones publicadas antes de guardar las carpetas: se asume que se llaman como las clases
+        self.carpetas_dataset = list(metadata.get("carpetas_dataset", self.clases))
+        self.input_size = tuple(metadata["input_size"])
+        # Una sola pasada devuelve el embedding de la penúltima capa y las probabilidades
+        self.extractor = tf.keras.Model(modelo.inputs, [modelo.layers[-2].output, modelo.outputs[0]])
+        # Pesos de la capa final: con el embedding dan los logits que usa la calibración
+        self.cabeza = [np.asarray(peso) for peso in modelo.layers[-1].get_weights()]
+        self.calibracion = metadata.get("calibracion")
+
+    def con_calibracion(self, calibracion):
+        # Comparte modelo y extractor (ya calentado): solo cambia cómo se interpretan los logits
+        nuevo = copy.copy(self)
+        nuevo.metadata = {**self.metadata, "calibracion": calibracion}
+        nuevo.calibracion = calibracion
+        return nuevo
+
+    def calentar(self):
+        entrada = np.zeros((1, *self.input_size, 3), dtype=np.float32)
+        for _ in range(2):
+            self.extractor(entrada, training=False)
+
+
+# --- Contenedor intercambiable del modelo ---
+class ContenedorModelo:
+    def __init__(self, registro, estado):
+        self.registro = registro
+        self._estado = estado
+        self._marca = registro.marca_actual()
+        self._lock_recarga = threading.Lock()
+        self._suscriptores = []
+        self.ultimo_error = None
+
+    def suscribir(self, funcion):
+        # funcion(estado) se llama tras cada cambio de versión (p. ej. para recargar workers)
+        self._suscriptores.append(funcion)
+
+    def actual(self):
+        # Cada petición toma su propia referencia: si hay un cambio a mitad, termina con la versión vieja
+        return self._estado
+
+    def reemplazar(self, estado):
+        anterior = self._estado
+        self._estado = estado
+        del anterior
+        gc.collect()
+        # El cambio ya está hecho: un suscriptor que falla no debe impedir que se avise al resto
+        errores = []
+        for funcion in self._suscriptores:
+            try:
+                funcion(estado)
+            except Exception as e:
+                errores.append(f"{getattr(funcion, '__qualname__', funcion)}: {e}")
+        if errores:
+            self.ultimo_error = f"Error al notificar el cambio a {estado.version}: " + "; ".join(errores)
+
+    def recargar(self, version=None):
+        with self._lock_recarga:
+            version = version or self.registro.version_actual()
+            if version is None or version == self._estado.version:
+                return False
+            modelo, metadata = self.registro.cargar(version)
+            estado = EstadoModelo(modelo, metadata)
+            estado.calentar()
+            self.reemplazar(estado)
+            return True
+
+    def recargar_en_segundo_plano(self, version=None):
+        def ejecutar():
+            try:
+                # Se limpia antes: los errores de los suscriptores que deje recargar() deben verse
+                self.ultimo_error = None
+                self.recargar(version)
+            except Exception as e:
+                self.ultimo_error = f"Error al recargar el modelo: {e}"
+
+        hilo = threading.Thread(target=ejecutar, name="recarga-modelo", daemon=True)
+        hilo.start()
+        return hilo
+
+    def publicar_y_activar(self, modelo, metricas=None, origen="manual", misma_base=False):
+        # Con el cerrojo, vigilar() no puede ver el nuevo ACTUAL y cargar la misma versión otra vez desde disco
+        with self._lock_recarga:
+            estado_actual = self._estado
+            version = self.registro.publicar(
+                modelo, estado_actual.clases, metricas, origen,
+                base=estado_actual.version_base if misma_base else None,
+                carpetas_dataset=estado_actual.carpetas_dataset,
+            )
+            self.registro.activar(version)
+            self._marca = self.registro.marca_actual()
+            estado = EstadoModelo(modelo, self.registro.metadata(version))
+            estado.calentar()
+            self.reemplazar(estado)
+        return version
+
+    def aplicar_calibracion(self, version, calibracion):
+        # Bajo el mismo lock que las recargas: sin él, una versión activada entre la comprobación y
+        # reemplazar() quedaría pisada por la copia calibrada de la anterior
+        with self._lock_recarga:
+            self.registro.guardar_calibracion(version, calibracion)
+            estado_actual = self._estado
+            if estado_actual.version == version:
+                self.reemplazar(estado_actual.con_calibracion(calibracion))
+
+    def vigilar(self, intervalo=INTERVALO_VIGILANCIA):
+        # Detecta cambios en el puntero ACTUAL y recarga sin reiniciar el servidor
+        def bucle():
+            while True:
+                time.sleep(intervalo)
+                marca = self.registro.marca_actual()
+                if marca != self._marca:
+                    self._marca = marca
+                    try:
+                        self.ultimo_error = None
+                        self.recargar()
+                    except Exception as e:
+                        self.ultimo_error = f"Error al recargar el modelo: {e}"
+
+        hilo = threading.Thread(target=bucle, name="vigilancia-registro", daemon=True)
+        hilo.start()
+        return hilo
+
+
+# --- Carga inicial ---
+def iniciar_contenedor(registro, importar_legado=None):
+    # Si el registro está vacío se importa el modelo heredado como primera versión
+    if registro.version_actual() is None:
+        if importar_legado is None:
+            raise FileNotFoundError(f"No hay modelos en el registro '{registro.directorio}'")
+        modelo, clases, carpetas_dataset = importar_legado()
+        version = registro.publicar(modelo, clases, origen="legado", carpetas_dataset=carpetas_dataset)
+        registro.activar(version)
+
+    version = registro.version_actual()
+    modelo, metadata = registro.cargar(version)
+    estado = EstadoModelo(modelo, metadata)
+    estado.calentar()
+    return ContenedorModelo(registro, estado)
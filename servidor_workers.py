@@ -0,0 +1,209 @@
+import importlib
+import importlib.util
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+# --- Configuración ---
+# MODO_SERVICIO=workers activa el servicio multiproceso; NUM_WORKERS fija cuántos procesos se lanzan
+MODO_SERVICIO = os.environ.get("MODO_SERVICIO", "local")
+NUM_WORKERS = int(os.environ.get("NUM_WORKERS", os.cpu_count() or 1))
+ARCHIVO_TFLITE = "modelo.tflite"
+TIEMPO_ESPERA = 60
+TIEMPO_PARADA = 30
+
+
+# --- Exportación a TFLite ---
+# Los pesos se comparten entre workers: el intérprete se crea sin el delegado XNNPACK por defecto, que
+# copiaba los pesos a memoria privada de cada proceso, y los lee directamente del .tflite mapeado en
+# memoria (páginas de la caché de ficheros, comunes a todos). Los workers nacen de un forkserver que ya
+# importó el runtime, así que tampoco repiten la importación de TensorFlow. Con el modelo del notebook
+# (42.6 MB en TFLite), benchmarks/servidor_workers.py mide ~30 MB de PSS por worker adicional (antes
+# ~320 MB) y 713 MB en total con 8 workers (antes 2707 MB). A cambio, sin XNNPACK cada imagen tarda
+# aproximadamente el doble por núcleo (29 frente a ~55 img/s con una CPU).
+def exportar_tflite(registro, estado):
+    ruta = os.path.join(registro.directorio, estado.version, ARCHIVO_TFLITE)
+    if os.path.exists(ruta):
+        return ruta
+
+    import tensorflow as tf
+    # Se exporta el modelo de dos salidas para conservar el embedding que usa el feedback
+    convertidor = tf.lite.TFLiteConverter.from_keras_model(estado.extractor)
+    contenido = convertidor.convert()
+    temporal = ruta + ".tmp"
+    with open(temporal, "wb") as f:
+        f.write(contenido)
+    os.replace(temporal, ruta)
+    return ruta
+
+
+# Runtimes por orden de preferencia: los paquetes ligeros evitan cargar TensorFlow completo
+RUNTIMES_TFLITE = ("ai_edge_litert.interpreter", "tflite_runtime.interpreter", "tensorflow")
+
+
+def _modulo_runtime():
+    for nombre in RUNTIMES_TFLITE:
+        try:
+            if importlib.util.find_spec(nombre) is not None:
+                return nombre
+        except ImportError:
+            continue
+    raise ImportError("No hay runtime de TFLite: instala ai-edge-litert, tflite-runtime o tensorflow")
+
+
+def _crear_interprete(ruta, hilos):
+    modulo = importlib.import_module(_modulo_runtime())
+    if modulo.__name__ == "tensorflow":
+        # tensorflow.lite solo expone Interpreter como atributo: "from tensorflow.lite import" falla
+        Interpreter, OpResolverType = modulo.lite.Interpreter, modulo.lite.experimental.OpResolverType
+    else:
+        Interpreter, OpResolverType = modulo.Interpreter, modulo.OpResolverType
+    # Sin delegados por defecto los kernels leen los pesos del flatbuffer mapeado en lugar de copiarlos
+    return Interpreter(model_path=ruta, num_threads=hilos,
+                       experimental_op_resolver_type=OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES)
+
+
+def _contexto_workers():
+    # Un forkserver con el runtime ya importado: cada worker hereda esas páginas en lugar de volver a
+    # importar TensorFlow. Donde no existe (Windows) se arranca cada worker desde cero.
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    contexto = multiprocessing.get_context("forkserver")
+    contexto.set_forkserver_preload([_modulo_runtime()])
+    return contexto
+
+
+# --- Proceso worker ---
+def _bucle_worker(ruta, hilos, entrada, salida):
+    # Limitar los hilos antes de cargar el intérprete evita la sobresuscripción entre workers
+    for variable in ("OMP_NUM_THREADS", "TF_NUM_INTRAOP_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[variable] = str(hilos)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+
+    interprete = _crear_interprete(ruta, hilos)
+    detalle_entrada = interprete.get_input_details()[0]
+    # El orden de salidas de TFLite no está garantizado: el embedding es la salida más ancha
+    salidas = sorted(interprete.get_output_details(), key=lambda d: d["shape"][-1], reverse=True)
+    tamano_lote = None
+
+    while True:
+        mensaje = entrada.get()
+        if mensaje is None:
+            break
+        id_peticion, lote = mensaje
+        try:
+            if lote.shape[0] != tamano_lote:
+                interprete.resize_tensor_input(detalle_entrada["index"], lote.shape)
+                interprete.allocate_tensors()
+                tamano_lote = lote.shape[0]
+            interprete.set_tensor(detalle_entrada["index"], lote.astype(np.float32, copy=False))
+            interprete.invoke()
+            embedding = interprete.get_tensor(salidas[0]["index"]).copy()
+            pred = interprete.get_tensor(salidas[1]["index"]).copy()
+            salida.put((id_peticion, (embedding, pred), None))
+        except Exception as e:
+            salida.put((id_peticion, None, repr(e)))
+
+
+# --- Grupo de workers que atiende una versión del modelo ---
+class _GrupoWorkers:
+    def __init__(self, contexto, ruta, version, num_workers, hilos, salida):
+        self.ruta = ruta
+        self.version = version
+        self.entrada = contexto.Queue()
+        self.procesos = [
+            contexto.Process(target=_bucle_worker, args=(ruta, hilos, self.entrada, salida),
+                             name=f"worker-modelo-{i}", daemon=True)
+            for i in range(num_workers)
+        ]
+        for proceso in self.procesos:
+            proceso.start()
+
+    def detener(self):
+        # Las señales de parada van detrás de las peticiones pendientes: primero se vacía la cola
+        for _ in self.procesos:
+            self.entrada.put(None)
+
+    def esperar(self, tiempo_espera=TIEMPO_PARADA):
+        # Recoge los procesos terminados; si alguno no atiende la parada se fuerza su salida
+        limite = time.monotonic() + tiempo_espera
+        for proceso in self.procesos:
+            proceso.join(max(0.0, limite - time.monotonic()))
+            if proceso.is_alive():
+                proceso.terminate()
+                proceso.join()
+
+
+# --- Fachada usada por la app ---
+class ServidorWorkers:
+    def __init__(self, ruta_tflite, version=None, num_workers=NUM_WORKERS, hilos_por_worker=None):
+        self.num_workers = max(1, num_workers)
+        self.hilos_por_worker = hilos_por_worker or max(1, (os.cpu_count() or 1) // self.num_workers)
+        self._contexto = _contexto_workers()
+        self._salida = self._contexto.Queue()
+        self._pendientes = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._grupo = _GrupoWorkers(self._contexto, ruta_tflite, version, self.num_workers,
+                                    self.hilos_por_worker, self._salida)
+        self._receptor = threading.Thread(target=self._recibir, name="receptor-workers", daemon=True)
+        self._receptor.start()
+
+    @property
+    def ruta(self):
+        return self._grupo.ruta
+
+    @property
+    def version(self):
+        return self._grupo.version
+
+    def _recibir(self):
+        while True:
+            id_peticion, resultado, error = self._salida.get()
+            with self._lock:
+                buzon = self._pendientes.pop(id_peticion, None)
+            if buzon is not None:
+                buzon.put((resultado, error))
+
+    def clasificar(self, lote, tiempo_espera=TIEMPO_ESPERA):
+        # Devuelve ((embedding, pred), versión del grupo que atendió la petición)
+        buzon = queue.Queue(maxsize=1)
+        id_peticion = next(self._ids)
+        lote = np.ascontiguousarray(lote, dtype=np.float32)
+        with self._lock:
+            self._pendientes[id_peticion] = buzon
+            # Bajo el mismo lock que recargar(): ninguna petición cae en un grupo ya detenido
+            grupo = self._grupo
+            grupo.entrada.put((id_peticion, lote))
+        try:
+            resultado, error = buzon.get(timeout=tiempo_espera)
+        except queue.Empty:
+            with self._lock:
+                self._pendientes.pop(id_peticion, None)
+            raise TimeoutError("Los workers del modelo no respondieron a tiempo")
+        if error:
+            raise RuntimeError(f"Error en el worker del modelo: {error}")
+        return resultado, grupo.version
+
+    def recargar(self, ruta_tflite, version=None):
+        if ruta_tflite == self._grupo.ruta:
+            return
+        nuevo = _GrupoWorkers(self._contexto, ruta_tflite, version, self.num_workers,
+                              self.hilos_por_worker, self._salida)
+        with self._lock:
+            anterior, self._grupo = self._grupo, nuevo
+            anterior.detener()
+        # El grupo anterior termina sus peticiones en cola; se recoge aparte para no bloquear la recarga
+        threading.Thread(target=anterior.esperar, name="parada-workers", daemon=True).start()
+
+    def pids(self):
+        return [proceso.pid for proceso in self._grupo.procesos]
+
+    def detener(self):
+        self._grupo.detener()
+        self._grupo.esperar()
@@ -0,0 +1,62 @@
+# --- Pruebas de Grad-CAM sobre modelos cargados del registro ---
+# Uso: python -m pytest tests
+# La app siempre sirve modelos leídos de .keras con RegistroModelos.cargar: se prueba ese camino,
+# no el modelo recién construido en memoria.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from explicabilidad import ExplicadorGradCAM
+from registro_modelos import EstadoModelo, RegistroModelos
+
+CLASES = ['cartón', 'vidrio', 'metal', 'papel', 'plástico', 'basura']
+
+
+def modelo_notebook(lado=64):
+    # Misma pila de capas que el notebook, a menor resolución
+    from tensorflow.keras import layers, models
+    return models.Sequential([
+        layers.Input(shape=(lado, lado, 3)),
+        layers.Conv2D(8, (3, 3), activation='relu'),
+        layers.MaxPooling2D(2, 2),
+        layers.Conv2D(16, (3, 3), activation='relu'),
+        layers.MaxPooling2D(2, 2),
+        layers.Flatten(),
+        layers.Dense(32, activation='relu'),
+        layers.Dropout(0.5),
+        layers.Dense(len(CLASES), activation='softmax'),
+    ])
+
+
+@pytest.fixture
+def estado_cargado(tmp_path):
+    registro = RegistroModelos(str(tmp_path))
+    version = registro.publicar(modelo_notebook(), CLASES)
+    return EstadoModelo(*registro.cargar(version))
+
+
+def test_gradcam_con_modelo_cargado_del_registro(estado_cargado):
+    lote = np.random.default_rng(0).random((3, 64, 64, 3), dtype=np.float32)
+    embedding, pred, mapas = ExplicadorGradCAM(estado_cargado).explicar(lote)
+
+    assert mapas.shape == (3, 29, 29)
+    assert np.isfinite(mapas).all() and mapas.min() >= 0 and mapas.max() <= 1 + 1e-6
+    # Predicción y embedding iguales a los del extractor normal: el mapa no cambia la clasificación
+    embedding_ref, pred_ref = estado_cargado.extractor(lote, training=False)
+    np.testing.assert_allclose(embedding, embedding_ref, atol=1e-5)
+    np.testing.assert_allclose(pred, pred_ref, atol=1e-5)
+
+
+def test_gradcam_reutiliza_la_cache_por_hash(estado_cargado):
+    explicador = ExplicadorGradCAM(estado_cargado)
+    lote = np.random.default_rng(1).random((2, 64, 64, 3), dtype=np.float32)
+    _, _, mapas = explicador.explicar(lote, ["a", "b"])
+    # Con el hash conocido no se vuelve a mirar la imagen: sale el mapa guardado
+    _, _, repetidos = explicador.explicar(np.zeros_like(lote), ["a", "b"])
+    np.testing.assert_array_equal(mapas, repetidos)
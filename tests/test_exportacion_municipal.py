@@ -0,0 +1,63 @@
+# --- Pruebas del almacén de eventos municipales ---
+# Uso: python -m pytest tests
+import glob
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import exportacion_municipal
+from exportacion_municipal import AlmacenEventos
+
+# 2024-03-01 12:00 UTC
+INSTANTE = 1_709_294_400
+
+
+def registrar_partes(almacen, partes, eventos_por_parte):
+    for parte in range(partes):
+        for i in range(eventos_por_parte):
+            almacen.registrar("papel", "Reciclable", 0.9, 40.0, -3.7, instante=INSTANTE + parte * 60 + i)
+        almacen.vaciar()
+
+
+def eventos_del_dia(almacen):
+    return sum(almacen.consultar("2024-03-01", "2024-03-01")["eventos"].to_pylist())
+
+
+def test_compacta_y_agrega_los_dias_sucios(tmp_path):
+    almacen = AlmacenEventos(str(tmp_path))
+    registrar_partes(almacen, 3, 5)
+
+    assert almacen.mantenimiento() == ["2024-03-01"]
+    archivos = glob.glob(os.path.join(almacen.dir_eventos, "fecha=2024-03-01", "*.parquet"))
+    assert [os.path.basename(ruta)[:9] for ruta in archivos] == ["compacto-"]
+    assert eventos_del_dia(almacen) == 15
+
+
+def test_caida_tras_escribir_el_compacto_no_duplica_eventos(tmp_path, monkeypatch):
+    almacen = AlmacenEventos(str(tmp_path))
+    registrar_partes(almacen, 3, 5)
+
+    # El proceso cae justo después de escribir el compacto, sin haber borrado ninguna parte
+    def caida(ruta):
+        raise SystemExit("proceso terminado")
+
+    monkeypatch.setattr(exportacion_municipal.os, "remove", caida)
+    with pytest.raises(SystemExit):
+        almacen.mantenimiento()
+    monkeypatch.undo()
+    directorio = os.path.join(almacen.dir_eventos, "fecha=2024-03-01")
+    assert len(glob.glob(os.path.join(directorio, "*.parquet"))) == 4
+
+    # Al arrancar, las partes que ya reúne el compacto se retiran en lugar de contarse otra vez
+    reiniciado = AlmacenEventos(str(tmp_path))
+    assert len(glob.glob(os.path.join(directorio, "*.parquet"))) == 1
+    reiniciado.mantenimiento()
+    assert eventos_del_dia(reiniciado) == 15
+
+    # Eventos nuevos después del arranque se suman una sola vez
+    registrar_partes(reiniciado, 1, 2)
+    reiniciado.mantenimiento()
+    assert eventos_del_dia(reiniciado) == 17
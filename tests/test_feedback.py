@@ -0,0 +1,33 @@
+# --- Pruebas del almacén de correcciones ---
+# Uso: python -m pytest tests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from feedback import AlmacenFeedback, Reentrenador
+
+
+def registrar_correcciones(almacen, cantidad, desde=0):
+    for i in range(desde, desde + cantidad):
+        almacen.registrar(f"hash{i}", "papel", "cartón", 0.4, np.zeros(4), "v1")
+
+
+def test_correcciones_usadas_sobreviven_al_reinicio(tmp_path):
+    almacen = AlmacenFeedback(str(tmp_path))
+    registrar_correcciones(almacen, 25)
+    assert Reentrenador(almacen, None, None).pendientes() == 25
+
+    # Un reentrenamiento (aceptado o rechazado) consume las correcciones que había
+    almacen.marcar_usadas(25)
+    registrar_correcciones(almacen, 3, desde=25)
+
+    # Tras reiniciar la app no se vuelve a lanzar con las mismas 25 correcciones
+    reiniciado = Reentrenador(AlmacenFeedback(str(tmp_path)), None, None)
+    assert reiniciado.pendientes() == 3
+    assert reiniciado.lanzar_si_corresponde() is False
@@ -0,0 +1,35 @@
+# --- Pruebas de la exportación de spans ---
+# Uso: python -m pytest tests
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metricas import ExportadorSpans, Histograma, medir
+
+
+def test_spans_en_formato_otlp_json(tmp_path):
+    ruta = str(tmp_path / "spans.jsonl")
+    exportador = ExportadorSpans(ruta)
+    histograma = Histograma("prueba", "", ("etapa",))
+    with medir("clasificacion", histograma, exportar=exportador, modelo="v3"):
+        with medir("inferencia", histograma, exportar=exportador, imagenes=4):
+            pass
+
+    # Nada se escribe en el hilo que mide: el archivo aparece al vaciar la cola
+    assert not os.path.exists(ruta)
+    assert exportador.vaciar() == 2
+    with open(ruta, encoding="utf-8") as f:
+        lotes = [json.loads(linea) for linea in f]
+
+    assert len(lotes) == 1
+    recurso = lotes[0]["resourceSpans"][0]
+    assert recurso["resource"]["attributes"][0]["key"] == "service.name"
+    hijo, padre = recurso["scopeSpans"][0]["spans"]
+    assert (padre["name"], hijo["name"]) == ("clasificacion", "inferencia")
+    assert hijo["traceId"] == padre["traceId"] and hijo["parentSpanId"] == padre["spanId"]
+    assert int(hijo["endTimeUnixNano"]) >= int(hijo["startTimeUnixNano"])
+    assert padre["attributes"] == [{"key": "modelo", "value": {"stringValue": "v3"}}]
+    assert hijo["attributes"] == [{"key": "imagenes", "value": {"intValue": "4"}}]
+    assert exportador.vaciar() == 0
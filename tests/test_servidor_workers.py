@@ -0,0 +1,57 @@
+# --- Pruebas del servicio multiproceso ---
+# Uso: python -m pytest tests
+# Modelos TFLite diminutos con la misma forma de salida que el extractor (embedding, predicción).
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from servidor_workers import ServidorWorkers
+
+
+def exportar_modelo(directorio, semilla):
+    from tensorflow.keras import layers
+    tf.keras.utils.set_random_seed(semilla)
+    entrada = tf.keras.Input(shape=(8, 8, 3))
+    embedding = layers.Dense(16, activation='relu')(layers.Flatten()(entrada))
+    pred = layers.Dense(6, activation='softmax')(embedding)
+    extractor = tf.keras.Model(entrada, [embedding, pred])
+    ruta = os.path.join(directorio, f"modelo-{semilla}.tflite")
+    with open(ruta, "wb") as f:
+        f.write(tf.lite.TFLiteConverter.from_keras_model(extractor).convert())
+    return ruta, extractor
+
+
+def test_clasifica_y_recoge_los_workers_al_recargar(tmp_path):
+    ruta_a, extractor_a = exportar_modelo(str(tmp_path), 1)
+    ruta_b, extractor_b = exportar_modelo(str(tmp_path), 2)
+    lote = np.random.default_rng(0).random((3, 8, 8, 3), dtype=np.float32)
+
+    servidor = ServidorWorkers(ruta_a, "v1", num_workers=2, hilos_por_worker=1)
+    try:
+        (embedding, pred), version = servidor.clasificar(lote)
+        assert version == "v1"
+        np.testing.assert_allclose(pred, extractor_a(lote)[1], atol=1e-5)
+        anteriores = list(servidor._grupo.procesos)
+
+        servidor.recargar(ruta_b, "v2")
+        (embedding, pred), version = servidor.clasificar(lote)
+        assert version == "v2"
+        np.testing.assert_allclose(embedding, extractor_b(lote)[0], atol=1e-5)
+
+        # El hilo de parada hace join() del grupo anterior: al acabar no queda ningún proceso vivo
+        fin = time.monotonic() + 30
+        while any(hilo.name == "parada-workers" for hilo in threading.enumerate()) and time.monotonic() < fin:
+            time.sleep(0.05)
+        assert not any(hilo.name == "parada-workers" for hilo in threading.enumerate())
+        assert [proceso.is_alive() for proceso in anteriores] == [False, False]
+    finally:
+        servidor.detener()
+    assert all(not proceso.is_alive() for proceso in servidor._grupo.procesos)
@@ -0,0 +1,192 @@
+# --- Pruebas de la cola de trabajos por lotes ---
+# Uso: python -m pytest tests
+# GestorTrabajos recibe la clasificación y la anotación como funciones: se prueban con sustitutos,
+# sin TensorFlow ni modelo.
+import csv
+import hashlib
+import io
+import os
+import sys
+import threading
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import trabajos
+from trabajos import GestorTrabajos
+
+
+def imagen_png(color=(200, 30, 30), lado=32):
+    buffer = io.BytesIO()
+    Image.new("RGB", (lado, lado), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class ClasificadorFalso:
+    def __init__(self, fallos=0):
+        self.fallos = fallos
+        self.llamadas = []
+        self.hashes = []
+        self._lock = threading.Lock()
+
+    def __call__(self, imagenes, con_mapa, hashes):
+        with self._lock:
+            self.llamadas.append((len(imagenes), con_mapa))
+            self.hashes.extend(hashes)
+            if self.fallos:
+                self.fallos -= 1
+                raise RuntimeError("modelo caído")
+        mapa = np.zeros((4, 4), dtype=np.float32) if con_mapa else None
+        return [("papel", 91.5, "Reciclable", mapa) for _ in imagenes]
+
+
+def anotar_falso(imagen, clase, confianza, mapa):
+    return np.zeros((8, 8, 3), dtype=np.uint8)
+
+
+def esperar(gestor, id_trabajo, limite=10):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        progreso = gestor.progreso(id_trabajo)
+        if progreso["estado"] == "terminado":
+            return progreso
+        time.sleep(0.02)
+    raise AssertionError(f"El trabajo {id_trabajo} no terminó: {gestor.progreso(id_trabajo)}")
+
+
+@pytest.fixture(autouse=True)
+def espera_corta(monkeypatch):
+    monkeypatch.setattr(trabajos, "ESPERA_SIN_TRABAJO", 0.01)
+
+
+def test_procesa_en_bloques_y_exporta(tmp_path):
+    clasificador = ClasificadorFalso()
+    gestor = GestorTrabajos(clasificador, anotar_falso, directorio=str(tmp_path), num_hilos=1, tamano_bloque=4)
+    id_trabajo = gestor.crear([(f"foto {i}.png", imagen_png()) for i in range(10)], con_mapa=True)
+
+    progreso = esperar(gestor, id_trabajo)
+    assert progreso["procesados"] == progreso["total"] == 10
+    assert clasificador.llamadas == [(4, True), (4, True), (2, True)]
+
+    resultados = gestor.resultados(id_trabajo)
+    assert [fila["indice"] for fila in resultados] == list(range(10))
+    assert {fila["clase"] for fila in resultados} == {"papel"}
+    assert all(os.path.exists(fila["miniatura"]) for fila in resultados)
+    # Solo lo posterior a "desde", para los refrescos incrementales de la vista
+    assert [fila["indice"] for fila in gestor.resultados(id_trabajo, desde=7)] == [7, 8, 9]
+
+    filas = list(csv.reader(io.StringIO(gestor.exportar_csv(id_trabajo).decode("utf-8"))))
+    assert filas[0][:4] == ["indice", "archivo", "estado", "clase"]
+    assert filas[1][1:6] == ["foto 0.png", "hecho", "papel", "91.50", "Reciclable"]
+    with zipfile.ZipFile(io.BytesIO(gestor.exportar_zip(id_trabajo))) as archivo_zip:
+        nombres = archivo_zip.namelist()
+    assert "resultados.csv" in nombres
+    assert sum(nombre.startswith("miniaturas/") for nombre in nombres) == 10
+
+
+def test_imagen_invalida_no_frena_el_resto(tmp_path):
+    clasificador = ClasificadorFalso()
+    gestor = GestorTrabajos(clasificador, anotar_falso, directorio=str(tmp_path), num_hilos=1)
+    id_trabajo = gestor.crear([("buena.png", imagen_png()), ("rota.png", b"no es una imagen"),
+                               ("otra.png", imagen_png())])
+
+    esperar(gestor, id_trabajo)
+    estados = {fila["nombre"]: (fila["estado"], fila["error"]) for fila in gestor.resultados(id_trabajo)}
+    assert estados["buena.png"] == ("hecho", None)
+    assert estados["otra.png"] == ("hecho", None)
+    assert estados["rota.png"][0] == "error" and "No se pudo leer" in estados["rota.png"][1]
+    # La imagen rechazada no llega al modelo
+    assert clasificador.llamadas == [(2, False)]
+
+
+def test_pasa_el_hash_del_contenido_para_la_cache_de_gradcam(tmp_path):
+    clasificador = ClasificadorFalso()
+    gestor = GestorTrabajos(clasificador, anotar_falso, directorio=str(tmp_path), num_hilos=1)
+    roja, azul = imagen_png((200, 30, 30)), imagen_png((30, 30, 200))
+    id_trabajo = gestor.crear([("roja.png", roja), ("azul.png", azul), ("roja otra vez.png", roja)], con_mapa=True)
+
+    esperar(gestor, id_trabajo)
+    # El mismo hash que la vista individual (sha256 de los bytes subidos): una imagen repetida reutiliza el mapa
+    assert clasificador.hashes == [hashlib.sha256(datos).hexdigest() for datos in (roja, azul, roja)]
+
+
+def test_fallo_del_modelo_marca_el_bloque_y_sigue(tmp_path):
+    clasificador = ClasificadorFalso(fallos=1)
+    gestor = GestorTrabajos(clasificador, anotar_falso, directorio=str(tmp_path), num_hilos=1)
+    fallido = gestor.crear([("a.png", imagen_png()), ("b.png", imagen_png())])
+    esperar(gestor, fallido)
+    assert {fila["estado"] for fila in gestor.resultados(fallido)} == {"error"}
+    assert "modelo caído" in gestor.resultados(fallido)[0]["error"]
+
+    # El hilo sigue atendiendo trabajos nuevos
+    siguiente = gestor.crear([("c.png", imagen_png())])
+    esperar(gestor, siguiente)
+    assert gestor.resultados(siguiente)[0]["estado"] == "hecho"
+
+
+def test_hilo_sobrevive_si_no_puede_guardar_el_error(tmp_path, monkeypatch):
+    clasificador = ClasificadorFalso(fallos=1)
+    guardar = GestorTrabajos._guardar
+    fallos_guardado = []
+
+    def guardar_que_falla_una_vez(self, conexion, id_trabajo, actualizaciones):
+        if not fallos_guardado:
+            fallos_guardado.append(id_trabajo)
+            conexion.execute("BEGIN IMMEDIATE")
+            raise OSError("disco lleno")
+        return guardar(self, conexion, id_trabajo, actualizaciones)
+
+    monkeypatch.setattr(GestorTrabajos, "_guardar", guardar_que_falla_una_vez)
+    gestor = GestorTrabajos(clasificador, anotar_falso, directorio=str(tmp_path), num_hilos=1)
+    perdido = gestor.crear([("a.png", imagen_png())])
+
+    fin = time.monotonic() + 10
+    while not fallos_guardado and time.monotonic() < fin:
+        time.sleep(0.02)
+    assert fallos_guardado == [perdido]
+
+    # La transacción que quedó abierta se deshace y el hilo procesa el siguiente trabajo
+    siguiente = gestor.crear([("b.png", imagen_png())])
+    esperar(gestor, siguiente)
+    assert gestor.resultados(siguiente)[0]["estado"] == "hecho"
+    assert all(hilo.is_alive() for hilo in gestor._hilos)
+    # El bloque cuyo error no se pudo anotar sigue reclamado hasta el próximo arranque
+    assert gestor.progreso(perdido)["procesados"] == 0
+
+
+def test_reinicio_devuelve_a_la_cola_lo_que_quedo_a_medias(tmp_path):
+    bloqueo = threading.Event()
+
+    def clasificador_bloqueado(imagenes, con_mapa, hashes):
+        bloqueo.wait()
+        raise RuntimeError("proceso terminado")
+
+    primero = GestorTrabajos(clasificador_bloqueado, anotar_falso, directorio=str(tmp_path), num_hilos=1)
+    id_trabajo = primero.crear([("a.png", imagen_png()), ("b.png", imagen_png())])
+    fin = time.monotonic() + 10
+    while primero.progreso(id_trabajo)["estado"] != "en_proceso" and time.monotonic() < fin:
+        time.sleep(0.02)
+    assert primero.progreso(id_trabajo)["estado"] == "en_proceso"
+
+    # Un segundo gestor sobre el mismo directorio simula el arranque tras una caída
+    segundo = GestorTrabajos(ClasificadorFalso(), anotar_falso, directorio=str(tmp_path), num_hilos=1)
+    progreso = esperar(segundo, id_trabajo)
+    assert progreso["procesados"] == 2
+    assert {fila["estado"] for fila in segundo.resultados(id_trabajo)} == {"hecho"}
+    bloqueo.set()
+
+
+def test_eliminar_borra_filas_y_archivos(tmp_path):
+    gestor = GestorTrabajos(ClasificadorFalso(), anotar_falso, directorio=str(tmp_path), num_hilos=1)
+    id_trabajo = gestor.crear([("a.png", imagen_png())])
+    esperar(gestor, id_trabajo)
+
+    gestor.eliminar(id_trabajo)
+    assert gestor.progreso(id_trabajo) is None
+    assert not os.path.exists(os.path.join(str(tmp_path), id_trabajo))
+    assert gestor.recientes() == []
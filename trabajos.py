@@ -0,0 +1,275 @@
+import csv
+import io
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+import zipfile
+
+import cv2
+
+from carga_imagenes import ImagenRechazada, cargar_imagen, hash_contenido
+
+# --- Configuración ---
+DIRECTORIO_TRABAJOS = "trabajos"
+HILOS_TRABAJOS = 2
+TAMANO_BLOQUE = 16
+LADO_MINIATURA = 256
+ESPERA_SIN_TRABAJO = 0.5
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    id TEXT PRIMARY KEY,
+    estado TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    procesados INTEGER NOT NULL DEFAULT 0,
+    creado TEXT NOT NULL,
+    terminado TEXT,
+    con_mapa INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS elementos (
+    trabajo_id TEXT NOT NULL,
+    indice INTEGER NOT NULL,
+    nombre TEXT NOT NULL,
+    ruta TEXT NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    clase TEXT,
+    confianza REAL,
+    tipo TEXT,
+    miniatura TEXT,
+    error TEXT,
+    PRIMARY KEY (trabajo_id, indice)
+);
+CREATE INDEX IF NOT EXISTS idx_elementos_estado ON elementos (estado, trabajo_id, indice);
+"""
+
+
+def _nombre_seguro(nombre):
+    return re.sub(r"[^\w.\-]", "_", os.path.basename(nombre))[:100] or "imagen"
+
+
+# --- Cola de trabajos persistente (SQLite + archivos, sin broker externo) ---
+class GestorTrabajos:
+    def __init__(self, clasificar_lote, anotar, directorio=DIRECTORIO_TRABAJOS,
+                 num_hilos=HILOS_TRABAJOS, tamano_bloque=TAMANO_BLOQUE):
+        # clasificar_lote(imagenes, con_mapa, hashes) -> [(clase, confianza, tipo, mapa o None), ...]
+        # (hashes: hash del contenido de cada archivo, clave de la caché de Grad-CAM)
+        # anotar(imagen, clase, confianza, mapa) -> array BGR listo para cv2.imwrite
+        self.clasificar_lote = clasificar_lote
+        self.anotar = anotar
+        self.directorio = directorio
+        self.tamano_bloque = tamano_bloque
+        self.ruta_db = os.path.join(directorio, "trabajos.db")
+        self._lock_reclamo = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+
+        with self._conectar() as conexion:
+            conexion.executescript(ESQUEMA)
+            # Bases creadas antes de existir los mapas de calor
+            columnas = {fila["name"] for fila in conexion.execute("PRAGMA table_info(trabajos)")}
+            if "con_mapa" not in columnas:
+                conexion.execute("ALTER TABLE trabajos ADD COLUMN con_mapa INTEGER NOT NULL DEFAULT 0")
+            # Lo que quedó a medias por un reinicio vuelve a la cola
+            conexion.execute("UPDATE elementos SET estado = 'pendiente' WHERE estado = 'en_proceso'")
+
+        self._hilos = [
+            threading.Thread(target=self._bucle, name=f"worker-trabajos-{i}", daemon=True)
+            for i in range(num_hilos)
+        ]
+        for hilo in self._hilos:
+            hilo.start()
+
+    def _conectar(self):
+        conexion = sqlite3.connect(self.ruta_db, timeout=30, isolation_level=None)
+        conexion.row_factory = sqlite3.Row
+        conexion.execute("PRAGMA journal_mode = WAL")
+        return _Conexion(conexion)
+
+    # --- Envío ---
+    def crear(self, archivos, con_mapa=False):
+        id_trabajo = uuid.uuid4().hex[:12]
+        dir_entrada = os.path.join(self.directorio, id_trabajo, "entrada")
+        os.makedirs(dir_entrada, exist_ok=True)
+
+        filas = []
+        for indice, (nombre, datos) in enumerate(archivos):
+            ruta = os.path.join(dir_entrada, f"{indice:05d}_{_nombre_seguro(nombre)}")
+            with open(ruta, "wb") as f:
+                f.write(datos)
+            filas.append((id_trabajo, indice, nombre, ruta))
+
+        with self._conectar() as conexion:
+            conexion.execute("BEGIN")
+            conexion.execute(
+                "INSERT INTO trabajos (id, estado, total, creado, con_mapa) VALUES (?, 'pendiente', ?, ?, ?)",
+                (id_trabajo, len(filas), time.strftime("%Y-%m-%d %H:%M:%S"), int(con_mapa)),
+            )
+            conexion.executemany(
+                "INSERT INTO elementos (trabajo_id, indice, nombre, ruta) VALUES (?, ?, ?, ?)", filas,
+            )
+            conexion.execute("COMMIT")
+        return id_trabajo
+
+    # --- Consulta ---
+    def progreso(self, id_trabajo):
+        with self._conectar() as conexion:
+            fila = conexion.execute("SELECT * FROM trabajos WHERE id = ?", (id_trabajo,)).fetchone()
+        return dict(fila) if fila else None
+
+    def resultados(self, id_trabajo, desde=0):
+        with self._conectar() as conexion:
+            filas = conexion.execute(
+                "SELECT indice, nombre, estado, clase, confianza, tipo, miniatura, error FROM elementos "
+                "WHERE trabajo_id = ? AND indice >= ? AND estado IN ('hecho', 'error') ORDER BY indice",
+                (id_trabajo, desde),
+            ).fetchall()
+        return [dict(fila) for fila in filas]
+
+    def recientes(self, limite=10):
+        with self._conectar() as conexion:
+            filas = conexion.execute(
+                "SELECT * FROM trabajos ORDER BY creado DESC LIMIT ?", (limite,),
+            ).fetchall()
+        return [dict(fila) for fila in filas]
+
+    # --- Exportación ---
+    def exportar_csv(self, id_trabajo):
+        salida = io.StringIO()
+        escritor = csv.writer(salida)
+        escritor.writerow(["indice", "archivo", "estado", "clase", "confianza", "tipo", "error"])
+        for fila in self.resultados(id_trabajo):
+            confianza = f"{fila['confianza']:.2f}" if fila["confianza"] is not None else ""
+            escritor.writerow([fila["indice"], fila["nombre"], fila["estado"], fila["clase"] or "",
+                               confianza, fila["tipo"] or "", fila["error"] or ""])
+        return salida.getvalue().encode("utf-8")
+
+    def exportar_zip(self, id_trabajo):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archivo_zip:
+            archivo_zip.writestr("resultados.csv", self.exportar_csv(id_trabajo))
+            for fila in self.resultados(id_trabajo):
+                if fila["miniatura"] and os.path.exists(fila["miniatura"]):
+                    # Las miniaturas ya son PNG comprimidos: se guardan sin volver a comprimir
+                    archivo_zip.write(fila["miniatura"], f"miniaturas/{os.path.basename(fila['miniatura'])}",
+                                      compress_type=zipfile.ZIP_STORED)
+        return buffer.getvalue()
+
+    def eliminar(self, id_trabajo):
+        with self._conectar() as conexion:
+            conexion.execute("BEGIN")
+            conexion.execute("DELETE FROM elementos WHERE trabajo_id = ?", (id_trabajo,))
+            conexion.execute("DELETE FROM trabajos WHERE id = ?", (id_trabajo,))
+            conexion.execute("COMMIT")
+        shutil.rmtree(os.path.join(self.directorio, id_trabajo), ignore_errors=True)
+
+    # --- Procesamiento en segundo plano ---
+    def _reclamar_bloque(self, conexion):
+        with self._lock_reclamo:
+            conexion.execute("BEGIN IMMEDIATE")
+            # Primero los trabajos más antiguos, así un lote grande no retrasa indefinidamente a otro
+            filas = conexion.execute(
+                "SELECT e.trabajo_id, e.indice, e.nombre, e.ruta, t.con_mapa FROM elementos e "
+                "JOIN trabajos t ON t.id = e.trabajo_id WHERE e.estado = 'pendiente' "
+                "ORDER BY t.creado, e.trabajo_id, e.indice LIMIT ?",
+                (self.tamano_bloque,),
+            ).fetchall()
+            # Un bloque nunca mezcla trabajos: se queda con los del primero
+            filas = [fila for fila in filas if fila["trabajo_id"] == filas[0]["trabajo_id"]] if filas else []
+            if filas:
+                conexion.executemany(
+                    "UPDATE elementos SET estado = 'en_proceso' WHERE trabajo_id = ? AND indice = ?",
+                    [(fila["trabajo_id"], fila["indice"]) for fila in filas],
+                )
+                conexion.execute("UPDATE trabajos SET estado = 'en_proceso' WHERE id = ?", (filas[0]["trabajo_id"],))
+            conexion.execute("COMMIT")
+        return [dict(fila) for fila in filas]
+
+    def _bucle(self):
+        with self._conectar() as conexion:
+            while True:
+                bloque = []
+                try:
+                    bloque = self._reclamar_bloque(conexion)
+                    if not bloque:
+                        time.sleep(ESPERA_SIN_TRABAJO)
+                        continue
+                    self._procesar_bloque(conexion, bloque)
+                except Exception as e:
+                    try:
+                        if conexion.in_transaction:
+                            conexion.execute("ROLLBACK")
+                        # Un fallo del bloque no debe dejar el trabajo colgado para siempre
+                        if bloque:
+                            self._guardar(conexion, bloque[0]["trabajo_id"], [
+                                ("error", None, None, None, None, f"Error al procesar: {e}",
+                                 elemento["trabajo_id"], elemento["indice"])
+                                for elemento in bloque
+                            ])
+                    except Exception:
+                        # Si tampoco se puede anotar el error (base bloqueada, disco lleno) el hilo sigue
+                        # vivo: el bloque queda 'en_proceso' y vuelve a la cola al reiniciar la app; una
+                        # transacción que quede abierta se deshace en la siguiente vuelta
+                        pass
+                    time.sleep(ESPERA_SIN_TRABAJO)
+
+    def _procesar_bloque(self, conexion, bloque):
+        id_trabajo = bloque[0]["trabajo_id"]
+        dir_miniaturas = os.path.join(self.directorio, id_trabajo, "miniaturas")
+        os.makedirs(dir_miniaturas, exist_ok=True)
+
+        validos, imagenes, hashes, actualizaciones = [], [], [], []
+        for elemento in bloque:
+            try:
+                with open(elemento["ruta"], "rb") as f:
+                    datos = f.read()
+                imagenes.append(cargar_imagen(datos, lado_preview=LADO_MINIATURA)[1])
+                hashes.append(hash_contenido(datos))
+                validos.append(elemento)
+            except (ImagenRechazada, OSError) as e:
+                actualizaciones.append(("error", None, None, None, None, str(e), id_trabajo, elemento["indice"]))
+
+        # Todo el bloque pasa por el modelo en una sola llamada
+        resultados = self.clasificar_lote(imagenes, bool(bloque[0]["con_mapa"]), hashes) if imagenes else []
+        for elemento, imagen, (clase, confianza, tipo, mapa) in zip(validos, imagenes, resultados):
+            ruta_miniatura = os.path.join(dir_miniaturas, f"{elemento['indice']:05d}_{clase}.png")
+            cv2.imwrite(ruta_miniatura, self.anotar(imagen, clase, confianza, mapa))
+            actualizaciones.append(("hecho", clase, float(confianza), tipo, ruta_miniatura, None,
+                                    id_trabajo, elemento["indice"]))
+
+        self._guardar(conexion, id_trabajo, actualizaciones)
+
+    def _guardar(self, conexion, id_trabajo, actualizaciones):
+        conexion.execute("BEGIN IMMEDIATE")
+        conexion.executemany(
+            "UPDATE elementos SET estado = ?, clase = ?, confianza = ?, tipo = ?, miniatura = ?, error = ? "
+            "WHERE trabajo_id = ? AND indice = ?",
+            actualizaciones,
+        )
+        conexion.execute(
+            "UPDATE trabajos SET procesados = (SELECT COUNT(*) FROM elementos "
+            "WHERE trabajo_id = ? AND estado IN ('hecho', 'error')) WHERE id = ?",
+            (id_trabajo, id_trabajo),
+        )
+        conexion.execute(
+            "UPDATE trabajos SET estado = 'terminado', terminado = ? WHERE id = ? AND procesados = total",
+            (time.strftime("%Y-%m-%d %H:%M:%S"), id_trabajo),
+        )
+        conexion.execute("COMMIT")
+
+
+# --- Conexión que se cierra al salir del bloque with ---
+class _Conexion:
+    def __init__(self, conexion):
+        self._conexion = conexion
+
+    def __getattr__(self, nombre):
+        return getattr(self._conexion, nombre)
+
+    def __enter__(self):
+        return self._conexion
+
+    def __exit__(self, *args):
+        self._conexion.close()
@@ -0,0 +1,141 @@
+import os
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# --- Configuración del muestreo ---
+# Cada cuánto se mira un fotograma para detectar cambios de escena (el resto solo se decodifica)
+FPS_REVISION = 5
+# Diferencia media (0-1) entre miniaturas en gris a partir de la cual se considera cambio de escena
+UMBRAL_ESCENA = 0.12
+# Aunque no cambie la escena, se toma una muestra como mínimo cada este intervalo
+INTERVALO_MAXIMO_S = 5.0
+# Y como máximo una muestra cada este intervalo, aunque haya mucho movimiento
+INTERVALO_MINIMO_S = 0.5
+TAMANO_LOTE = 16
+LADO_MUESTRA = 320
+TAMANO_HUELLA = (64, 36)
+EXTENSIONES_VIDEO = (".mp4", ".avi", ".mov", ".mkv")
+# Carpeta del servidor con grabaciones largas (DIRECTORIO_VIDEOS=...): se analizan en su sitio, sin pasar
+# por la subida de Streamlit, que guarda el archivo entero en memoria y está limitada por server.maxUploadSize
+DIRECTORIO_VIDEOS = os.environ.get("DIRECTORIO_VIDEOS")
+
+
+# --- Videos disponibles en la carpeta del servidor ---
+def listar_videos(directorio):
+    if not directorio or not os.path.isdir(directorio):
+        return []
+    return sorted(
+        entrada.path for entrada in os.scandir(directorio)
+        if entrada.is_file() and entrada.name.lower().endswith(EXTENSIONES_VIDEO)
+    )
+
+
+def _huella(fotograma):
+    # Miniatura en gris: comparar 2.304 píxeles es mucho más barato que el fotograma completo
+    pequeno = cv2.resize(fotograma, TAMANO_HUELLA, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(pequeno, cv2.COLOR_BGR2GRAY).astype(np.float32) / 255.0
+
+
+def _a_imagen(fotograma):
+    alto, ancho = fotograma.shape[:2]
+    escala = LADO_MUESTRA / max(alto, ancho)
+    if escala < 1:
+        fotograma = cv2.resize(fotograma, (int(ancho * escala), int(alto * escala)), interpolation=cv2.INTER_AREA)
+    return Image.fromarray(cv2.cvtColor(fotograma, cv2.COLOR_BGR2RGB))
+
+
+# --- Línea de tiempo por segmentos (se construye de forma incremental) ---
+class LineaTiempo:
+    def __init__(self):
+        self.segmentos = []
+        self.conteos = {}
+
+    def agregar(self, segundo, clase, confianza):
+        self.conteos[clase] = self.conteos.get(clase, 0) + 1
+        ultimo = self.segmentos[-1] if self.segmentos else None
+        if ultimo and ultimo["clase"] == clase:
+            ultimo["fin"] = segundo
+            ultimo["muestras"] += 1
+            ultimo["confianza"] += (confianza - ultimo["confianza"]) / ultimo["muestras"]
+        else:
+            if ultimo:
+                ultimo["fin"] = segundo
+            self.segmentos.append({"inicio": segundo, "fin": segundo, "clase": clase,
+                                   "muestras": 1, "confianza": confianza})
+
+    def cerrar(self, duracion):
+        if self.segmentos:
+            self.segmentos[-1]["fin"] = duracion
+
+
+# --- Análisis de un video ---
+def analizar_video(ruta, clasificar_lote, progreso=None, umbral_escena=UMBRAL_ESCENA,
+                   tamano_lote=TAMANO_LOTE):
+    # clasificar_lote(imagenes) -> [(clase, confianza, tipo, ...), ...]
+    # progreso(fraccion) se llama de vez en cuando para informar a la interfaz
+    captura = cv2.VideoCapture(ruta)
+    if not captura.isOpened():
+        raise ValueError("No se pudo abrir el video")
+
+    fps = captura.get(cv2.CAP_PROP_FPS) or 25.0
+    total_fotogramas = int(captura.get(cv2.CAP_PROP_FRAME_COUNT)) or 0
+    paso_revision = max(1, round(fps / FPS_REVISION))
+    linea = LineaTiempo()
+    lote, tiempos_lote = [], []
+    huella_anterior = None
+    ultimo_muestreo = -INTERVALO_MAXIMO_S
+    indice = muestreados = 0
+    inicio = time.perf_counter()
+
+    def vaciar_lote():
+        for segundo, (clase, confianza, *_) in zip(tiempos_lote, clasificar_lote(lote)):
+            linea.agregar(segundo, clase, confianza)
+        lote.clear()
+        tiempos_lote.clear()
+
+    try:
+        while True:
+            # grab() decodifica sin convertir a BGR; retrieve() solo en los fotogramas revisados
+            if not captura.grab():
+                break
+            if indice % paso_revision == 0:
+                ok, fotograma = captura.retrieve()
+                if ok:
+                    segundo = indice / fps
+                    huella = _huella(fotograma)
+                    cambio = huella_anterior is None or float(np.mean(np.abs(huella - huella_anterior))) > umbral_escena
+                    transcurrido = segundo - ultimo_muestreo
+                    if (cambio and transcurrido >= INTERVALO_MINIMO_S) or transcurrido >= INTERVALO_MAXIMO_S:
+                        lote.append(_a_imagen(fotograma))
+                        tiempos_lote.append(segundo)
+                        huella_anterior = huella
+                        ultimo_muestreo = segundo
+                        muestreados += 1
+                        if len(lote) >= tamano_lote:
+                            vaciar_lote()
+                            if progreso and total_fotogramas:
+                                progreso(min(1.0, indice / total_fotogramas))
+            indice += 1
+        if lote:
+            vaciar_lote()
+    finally:
+        captura.release()
+
+    duracion = indice / fps
+    linea.cerrar(duracion)
+    segundos_proceso = time.perf_counter() - inicio
+    if progreso:
+        progreso(1.0)
+    return {
+        "segmentos": linea.segmentos,
+        "conteos": linea.conteos,
+        "duracion": duracion,
+        "fps": fps,
+        "fotogramas": indice,
+        "muestreados": muestreados,
+        "segundos_proceso": segundos_proceso,
+        "velocidad": duracion / segundos_proceso if segundos_proceso else 0.0,
+    }